@@ -0,0 +1,108 @@
+# agent/catalog_store.py
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+import os
+import threading
+import time
+
+import pandas as pd
+
+from matching.engine import SOURCE_HASH_ATTR, catalog_content_hash, load_serving_catalog
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    path: str
+    version: str            # sha256 של קובץ הקטלוג
+    file_sig: tuple         # (mtime_ns, size, inode) — בדיקה זולה אם הקובץ הוחלף
+    frame: pd.DataFrame
+    loaded_at: float
+
+
+class CatalogStore:
+    """
+    Process-wide holder of the prepared serving catalog.
+
+    Loads once per path and hands the same frame to every caller. At most every
+    `check_interval` seconds it stats the file; if finalize_enriched_catalog.py /
+    merge_scraped_used.py replaced it (mtime/size changed and the content hash differs),
+    the new frame is loaded and swapped in with a single reference assignment.
+    Readers never wait on a reload: while one thread reloads, others keep getting the
+    previous snapshot. Treat the returned frame as read-only.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], pd.DataFrame] = load_serving_catalog,
+        check_interval: float = 2.0,
+    ):
+        self._loader = loader
+        self.check_interval = check_interval
+        self._snapshots: Dict[str, CatalogSnapshot] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._reload_lock = threading.Lock()
+
+    @staticmethod
+    def _file_sig(path: str) -> tuple:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def peek(self, path: str) -> Optional[CatalogSnapshot]:
+        return self._snapshots.get(os.path.abspath(path))
+
+    def get(self, path: str) -> CatalogSnapshot:
+        key = os.path.abspath(path)
+        snap = self._snapshots.get(key)
+        now = time.monotonic()
+        if snap is not None and now - self._checked_at.get(key, 0.0) < self.check_interval:
+            return snap
+        self._checked_at[key] = now
+
+        try:
+            sig = self._file_sig(key)
+        except OSError:
+            if snap is not None:
+                return snap  # הקובץ באמצע החלפה — ממשיכים עם הגרסה הקודמת
+            raise FileNotFoundError(f"Catalog not found: {path}")
+        if snap is not None and sig == snap.file_sig:
+            return snap
+
+        # טעינה ראשונה חוסמת; טעינה מחדש — רק thread אחד, השאר מקבלים את הגרסה הקיימת
+        if not self._reload_lock.acquire(blocking=snap is None):
+            return snap
+        try:
+            current = self._snapshots.get(key)
+            if current is not None and current is not snap and current.file_sig == sig:
+                return current  # thread אחר כבר טען בזמן שחיכינו
+            return self._reload(key, sig, current)
+        finally:
+            self._reload_lock.release()
+
+    def _reload(self, key: str, sig: tuple, current: Optional[CatalogSnapshot]) -> CatalogSnapshot:
+        try:
+            frame = self._loader(key)
+            # הגרסה = ה-hash שה-loader עצמו חישב על הבתים שמהם בנה את ה-frame (קריאה אחת של הקובץ);
+            # loader שלא מדווח hash — מחשבים כאן
+            version = frame.attrs.get(SOURCE_HASH_ATTR) or catalog_content_hash(key)
+            if current is not None and version == current.version:
+                frame = current.frame  # רק ה-mtime השתנה (touch / העתקה זהה) — אותו frame, caches חמים
+        except Exception:
+            if current is not None:
+                return current  # קובץ חצי-כתוב וכו' — ננסה שוב בבדיקה הבאה
+            raise
+        snap = CatalogSnapshot(path=key, version=version, file_sig=sig, frame=frame, loaded_at=time.time())
+        self._snapshots[key] = snap
+        return snap
+
+    def clear(self) -> None:
+        self._snapshots.clear()
+        self._checked_at.clear()
+
+
+_DEFAULT_STORE = CatalogStore()
+
+
+def get_catalog_store() -> CatalogStore:
+    return _DEFAULT_STORE
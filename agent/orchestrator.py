@@ -1,14 +1,31 @@
 # agent/orchestrator.py
 from __future__ import annotations
-from typing import Dict, Any, List
+from concurrent.futures import Executor
+from typing import Callable, ContextManager, Dict, Any, Iterator, List, Tuple
+import asyncio
+import contextlib
+import contextvars
+import copy
+import dataclasses
+import math
 import os
+import weakref
 import pandas as pd
 
 from matching.engine import (
+    RankingSession,
     UserProfile,
-    load_catalog,
     rank_cars,
+    vehicle_keys,
 )
+from matching.progressive import provisional_segment
+from matching.similarity import similar_to
+from matching.timing import RankTimings, stage_timing
+from agent.catalog_store import CatalogSnapshot, get_catalog_store
+from services.cache import MemoryCache
+
+# מקבעים תמיד ל-3 תוצאות — בהתאם לבקשה שלך
+TOP_N = 3
 
 def _to_float_or_none(val: Any) -> float | None:
     if val in [None, "", "null"]:
@@ -65,19 +82,31 @@ def _detect_catalog_path(explicit: str | None = None) -> str | None:
             return p
     return None
 
-def get_recommendations(answers: Dict[str, Any], catalog_path: str | None = None) -> Dict[str, Any]:
-    """
-    ממיר תשובות משתמש לפרופיל, טוען קטלוג, מריץ דירוג ומחזיר Top-N בפורמט פשוט ל-UI.
-    """
-    # 1) טעינת קטלוג
+def _catalog_snapshot(catalog_path: str | None = None) -> CatalogSnapshot:
     cat_path = _detect_catalog_path(catalog_path)
-    catalog = load_catalog(cat_path)
+    path = cat_path or os.getenv("CARMATCH_US_CATALOG", "data/catalog_us.parquet")
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Catalog not found: {path}")
+    return get_catalog_store().get(path)
 
-    # 2) בניית פרופיל מהתשובות
+def _weights_from_answers(raw: Any) -> Dict[str, float]:
+    """Slider overrides: only a dict, only finite numbers (numeric strings ok); the rest is dropped."""
+    if not isinstance(raw, dict):
+        return {}
+    weights: Dict[str, float] = {}
+    for key, val in raw.items():
+        if isinstance(val, bool):
+            continue
+        num = _to_float_or_none(val)
+        if num is not None and math.isfinite(num):
+            weights[str(key)] = num
+    return weights
+
+def _profile_from_answers(answers: Dict[str, Any]) -> UserProfile:
     budget = _to_float_or_none(answers.get("budget_usd", None))
     ownership_years = _to_int_or_default(answers.get("ownership_years", None), 3)
 
-    profile = UserProfile(
+    return UserProfile(
         new_or_used=answers.get("condition", "any"),
         usage=answers.get("usage", "mixed"),
         passengers=_to_int_or_default(answers.get("passengers", 4) or 4, 4) or 4,
@@ -88,15 +117,13 @@ def get_recommendations(answers: Dict[str, Any], catalog_path: str | None = None
         prioritize_safety=bool(answers.get("prioritize_safety", True)),
         prioritize_space=bool(answers.get("prioritize_space", False)),
         ownership_years=ownership_years or 3,   # ← מועבר ישירות כדי להפעיל אמינות
-        weights=answers.get("weights", {}) or {},
+        weights=_weights_from_answers(answers.get("weights", None)),
     )
 
-    # 3) פרמטרים משלימים
+def _rank_params(answers: Dict[str, Any]) -> Dict[str, Any]:
+    """Engine options for rank_cars (everything except the profile and catalog)."""
     fuel_type = _normalize_fuel_type(answers.get("fuel_type", "any"))
 
-    # מקבעים תמיד ל-3 תוצאות — בהתאם לבקשה שלך
-    top_n = 3
-
     min_mpg = answers.get("min_mpg", None)
     min_mpg = _to_float_or_none(min_mpg) if min_mpg is not None else None
 
@@ -106,24 +133,25 @@ def get_recommendations(answers: Dict[str, Any], catalog_path: str | None = None
     except Exception:
         max_share_per_fuel = 0.7
 
-    # 4) הרצת המנוע
-    ranked_df: pd.DataFrame = rank_cars(
-        profile=profile,
-        catalog=catalog,
-        top_n=top_n,
+    return dict(
+        top_n=TOP_N,
         min_mpg=min_mpg,
         max_per_model=max_per_model,
         max_share_per_fuel=max_share_per_fuel,
         fuel_type=fuel_type,
     )
 
-    # 5) פורמט ידידותי ל-UI
+def _format_items(ranked_df: pd.DataFrame) -> List[Dict[str, Any]]:
     wanted_cols = [
         "year",
         "make", "model", "option_text", "VClass", "fuelType",
         "passengers", "MPG_comb", "overall_safety", "Range_mi", "electricRange_mi",
-        "price_best", "price_source", "annual_fuel_cost", "score", "reasons"
+        "price_best", "price_source", "annual_fuel_cost", "score", "reasons",
+        "vehicle_key", "distance",
     ]
+    if "vehicle_key" not in ranked_df.columns and "make" in ranked_df.columns:
+        # מפתח יציב לכל רכב — ה-UI מעביר אותו חזרה ל-get_similar ("More like this")
+        ranked_df = ranked_df.assign(vehicle_key=vehicle_keys(ranked_df))
     cols = [c for c in wanted_cols if c in ranked_df.columns]
 
     items: List[Dict[str, Any]] = []
@@ -146,6 +174,11 @@ def get_recommendations(answers: Dict[str, Any], catalog_path: str | None = None
             except Exception:
                 pass
 
+        if item.get("vehicle_key") is not None:
+            item["vehicle_key"] = int(item["vehicle_key"])
+        if item.get("distance") is not None:
+            item["distance"] = round(float(item["distance"]), 3)
+
         # עלות דלק שנתית — עיצוב
         if item.get("annual_fuel_cost") is not None:
             try:
@@ -156,8 +189,212 @@ def get_recommendations(answers: Dict[str, Any], catalog_path: str | None = None
 
         items.append(item)
 
+    return items
+
+# ---------- Result cache ----------
+# מפתח = גרסת קטלוג + פרופיל קנוני + פרמטרי מנוע; החלפת קטלוג משנה את ה-namespace
+_RESULT_CACHE = MemoryCache(
+    maxsize=int(os.getenv("CARMATCH_RESULT_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("CARMATCH_RESULT_CACHE_TTL", "900")),
+)
+
+def _canonical(value: Any) -> Any:
+    if isinstance(value, dict):
+        return tuple(sorted((str(k), _canonical(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_canonical(v) for v in value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)  # 30000.0 ו-30000 — אותו מפתח
+    return value
+
+def _result_cache_key(catalog_version: str, profile: UserProfile, params: Dict[str, Any]) -> tuple:
+    return (
+        catalog_version,
+        _canonical(dataclasses.asdict(profile)),
+        _canonical(params),
+    )
+
+def result_cache_stats() -> Dict[str, Any]:
+    return _RESULT_CACHE.stats()
+
+def clear_result_cache() -> None:
+    _RESULT_CACHE.clear()
+
+def _prepare_request(answers: Dict[str, Any], catalog_path: str | None) -> Tuple[CatalogSnapshot, UserProfile, Dict[str, Any], tuple]:
+    snapshot = _catalog_snapshot(catalog_path)
+    profile = _profile_from_answers(answers)
+    params = _rank_params(answers)
+    return snapshot, profile, params, _result_cache_key(snapshot.version, profile, params)
+
+def _timing_scope(on_timings: Callable[[RankTimings], None] | None) -> ContextManager[None]:
+    # בלי sink משלה הבקשה לא מסתירה hook של הקורא (stage_timing חיצוני)
+    return stage_timing(on_timings) if on_timings is not None else contextlib.nullcontext()
+
+def _response(profile: UserProfile, items: List[Dict[str, Any]]) -> Dict[str, Any]:
     return {
         "profile": profile.__dict__,
         "count": len(items),
         "results": items,
-    }
\ No newline at end of file
+    }
+
+def _cached_items(key: tuple, on_timings: Callable[[RankTimings], None] | None) -> List[Dict[str, Any]] | None:
+    cached = _RESULT_CACHE.get(key)
+    if cached is None:
+        return None
+    if on_timings is not None:
+        on_timings(RankTimings(cached=True))
+    return copy.deepcopy(cached)  # ה-UI משנה את הפריטים במקום
+
+def _rank_items(
+    snapshot: CatalogSnapshot,
+    profile: UserProfile,
+    params: Dict[str, Any],
+    key: tuple,
+    session: RankingSession | None,
+    on_timings: Callable[[RankTimings], None] | None,
+) -> List[Dict[str, Any]]:
+    # 4) הרצת המנוע
+    rank = session.rank if session is not None else rank_cars
+    with _timing_scope(on_timings):
+        ranked_df: pd.DataFrame = rank(profile, snapshot.frame, **params)
+    # 5) פורמט ידידותי ל-UI
+    items = _format_items(ranked_df)
+    _RESULT_CACHE.set(key, copy.deepcopy(items))
+    return items
+
+def get_recommendations(
+    answers: Dict[str, Any],
+    catalog_path: str | None = None,
+    session: RankingSession | None = None,
+    on_timings: Callable[[RankTimings], None] | None = None,
+) -> Dict[str, Any]:
+    """
+    ממיר תשובות משתמש לפרופיל, טוען קטלוג, מריץ דירוג ומחזיר Top-N בפורמט פשוט ל-UI.
+    session: RankingSession של המשתמש (למשל מ-st.session_state) — תיקון של תשובה אחת
+    מחשב מחדש רק את השלבים שתלויים בה.
+    on_timings: sink למטריקות — מקבל RankTimings (זמן + מספר מועמדים לכל שלב) לכל בקשה;
+    פגיעה ב-cache מדווחת כ-cached=True בלי שלבים.
+    """
+    # 1) קטלוג — נטען פעם אחת לתהליך (CatalogStore) ומתרענן אוטומטית כשהקובץ מוחלף
+    # 2) בניית פרופיל ופרמטרים מהתשובות
+    snapshot, profile, params, key = _prepare_request(answers, catalog_path)
+
+    # 3) cache — אותן תשובות על אותה גרסת קטלוג לא מדורגות שוב
+    items = _cached_items(key, on_timings)
+    if items is None:
+        items = _rank_items(snapshot, profile, params, key, session, on_timings)
+    return _response(profile, items)
+
+def get_recommendations_progressive(
+    answers: Dict[str, Any],
+    catalog_path: str | None = None,
+    session: RankingSession | None = None,
+    on_timings: Callable[[RankTimings], None] | None = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    כמו get_recommendations, אבל generator: קודם תשובה זמנית (final=False) מתוך מקטע קטן
+    של הקטלוג (matching.progressive), ואז התשובה המלאה (final=True) — זהה ל-get_recommendations.
+    פגיעה ב-cache או קטלוג קטן — רק התשובה המלאה. התשובה הזמנית לא נשמרת ב-cache.
+    """
+    snapshot, profile, params, key = _prepare_request(answers, catalog_path)
+
+    items = _cached_items(key, on_timings)
+    if items is not None:
+        yield dict(_response(profile, items), final=True)
+        return
+
+    # ה-hook פעיל רק סביב כל דירוג, לא בין ה-yields (הקוד של הקורא רץ שם)
+    segment = provisional_segment(snapshot.frame)
+    if segment is not None:
+        with _timing_scope(on_timings):
+            provisional = rank_cars(profile, segment, **params)
+        yield dict(_response(profile, _format_items(provisional)), final=False)
+
+    items = _rank_items(snapshot, profile, params, key, session, on_timings)
+    yield dict(_response(profile, items), final=True)
+
+# ---------- Async ----------
+# דירוגים שרצים בו-זמנית (לכל event loop); פגיעות cache לא תופסות מקום
+MAX_CONCURRENT_RANKS = int(os.getenv("CARMATCH_MAX_CONCURRENT_RANKS", "4"))
+_LIMITERS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+def _rank_limiter() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    limiter = _LIMITERS.get(loop)
+    if limiter is None:
+        limiter = _LIMITERS[loop] = asyncio.Semaphore(MAX_CONCURRENT_RANKS)
+    return limiter
+
+async def get_recommendations_async(
+    answers: Dict[str, Any],
+    catalog_path: str | None = None,
+    session: RankingSession | None = None,
+    on_timings: Callable[[RankTimings], None] | None = None,
+    executor: Executor | None = None,
+) -> Dict[str, Any]:
+    """
+    get_recommendations ל-event loop: טעינת הקטלוג והדירוג רצים ב-executor (ברירת מחדל —
+    ה-thread pool של ה-loop), עם context מועתק כך ש-stage_timing / contextvars של הקורא עובדים.
+    לכל היותר MAX_CONCURRENT_RANKS דירוגים בבת אחת; פגיעת cache חוזרת בלי לחכות בתור.
+    ביטול (task.cancel / timeout) משחרר את הקורא מיד. דירוג שכבר התחיל רץ עד הסוף ברקע —
+    התוצאה נכנסת ל-cache — והמקום בתור מתפנה רק כשהוא מסתיים, כך שהמגבלה נשמרת.
+    """
+    loop = asyncio.get_running_loop()
+    # טעינה ראשונה / טעינה מחדש של הקטלוג = I/O חוסם
+    snapshot, profile, params, key = await loop.run_in_executor(
+        executor, contextvars.copy_context().run, _prepare_request, answers, catalog_path,
+    )
+    items = _cached_items(key, on_timings)
+    if items is None:
+        limiter = _rank_limiter()
+        await limiter.acquire()
+        try:
+            # בקשה זהה שחיכתה בתור אחרי זו שכבר דורגה
+            items = _cached_items(key, on_timings)
+            if items is not None:
+                limiter.release()
+                return _response(profile, items)
+            job = loop.run_in_executor(
+                executor, contextvars.copy_context().run,
+                _rank_items, snapshot, profile, params, key, session, on_timings,
+            )
+        except BaseException:
+            limiter.release()
+            raise
+
+        def _done(fut: asyncio.Future) -> None:
+            limiter.release()
+            if not fut.cancelled():
+                fut.exception()  # נצרך גם אם הקורא כבר בוטל — בלי "exception was never retrieved"
+
+        job.add_done_callback(_done)
+        items = await asyncio.shield(job)
+    return _response(profile, items)
+
+def _similar_filters(answers: Dict[str, Any]) -> Dict[str, Any]:
+    """Hard constraints from the user's answers, applied to the "More like this" list too."""
+    return {
+        "fuel_type": _normalize_fuel_type(answers.get("fuel_type", "any")),
+        "budget": _to_float_or_none(answers.get("budget_usd", None)),
+        "passengers": _to_int_or_default(answers.get("passengers", None), None),
+        "prioritize_space": bool(answers.get("prioritize_space", False)),
+    }
+
+def get_similar(
+    vehicle_key: int,
+    k: int = 3,
+    answers: Dict[str, Any] | None = None,
+    catalog_path: str | None = None,
+) -> Dict[str, Any]:
+    """
+    "More like this": k רכבים קרובים ל-vehicle_key (מתוך item["vehicle_key"] של get_recommendations),
+    בתוך האילוצים הקשיחים של answers אם ניתנו. אותו פורמט פריטים כמו get_recommendations, + distance.
+    """
+    snapshot = _catalog_snapshot(catalog_path)
+    filters = _similar_filters(answers) if answers else None
+    items = _format_items(similar_to(snapshot.frame, int(vehicle_key), k=k, filters=filters))
+    return {
+        "vehicle_key": int(vehicle_key),
+        "count": len(items),
+        "results": items,
+    }
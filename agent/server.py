@@ -0,0 +1,186 @@
+# agent/server.py
+# שרת המלצות ארוך-חיים: הקטלוג נטען ומוכן פעם אחת, בקשות רצות על worker pool קבוע
+# הרצה: python -m agent.server --catalog data/catalog_us.parquet --port 8765 --workers 4
+#
+#   GET  /healthz    — התהליך חי
+#   GET  /readyz     — 200 אחרי שהקטלוג נטען וחומם, 503 עד אז (או אם הטעינה נכשלה)
+#   POST /recommend  — גוף JSON = אותו answers כמו get_recommendations
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+import argparse
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from agent.orchestrator import _catalog_snapshot, get_recommendations
+
+MAX_BODY_BYTES = 64 * 1024
+
+
+def _json_default(value: Any) -> Any:
+    if value is pd.NA or value is pd.NaT:
+        return None
+    return str(value)
+
+
+def _clean(value: Any) -> Any:
+    # NaN/inf אינם JSON חוקי
+    if isinstance(value, dict):
+        return {str(k): _clean(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_clean(v) for v in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+class RecommendationServer(ThreadingHTTPServer):
+    """
+    ThreadingHTTPServer that owns the worker pool: connection threads only parse and reply,
+    ranking runs on at most `workers` threads. The catalog goes through the process-wide
+    CatalogStore, so a replaced catalog file is picked up without a restart.
+    """
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        catalog_path: Optional[str] = None,
+        workers: int = 4,
+        request_timeout: float = 30.0,
+    ):
+        super().__init__(address, RecommendationHandler)
+        self.catalog_path = catalog_path
+        self.request_timeout = request_timeout
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="carmatch-rank")
+        self.ready = threading.Event()
+        self.load_error: Optional[str] = None
+        self.catalog_info: Dict[str, Any] = {}
+
+    def preload(self) -> None:
+        """Loads + prepares the catalog and runs one warm-up rank (filter index etc.)."""
+        try:
+            t = time.perf_counter()
+            snapshot = _catalog_snapshot(self.catalog_path)
+            get_recommendations({}, catalog_path=self.catalog_path)
+            self.catalog_info = {
+                "catalog_version": snapshot.version,
+                "rows": len(snapshot.frame),
+                "warmup_ms": round((time.perf_counter() - t) * 1e3, 1),
+            }
+            self.ready.set()
+        except Exception as e:
+            self.load_error = f"{type(e).__name__}: {e}"
+
+    def start_preload(self) -> threading.Thread:
+        thread = threading.Thread(target=self.preload, name="carmatch-preload", daemon=True)
+        thread.start()
+        return thread
+
+    def recommend(self, answers: Dict[str, Any]) -> Dict[str, Any]:
+        job = self.pool.submit(get_recommendations, answers, self.catalog_path)
+        return job.result(timeout=self.request_timeout)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class RecommendationHandler(BaseHTTPRequestHandler):
+    server: RecommendationServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if os.getenv("CARMATCH_SERVER_LOG"):
+            super().log_message(format, *args)
+
+    def _send(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(_clean(payload), default=_json_default, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path == "/healthz":
+            self._send(200, {"status": "ok"})
+        elif self.path == "/readyz":
+            if self.server.ready.is_set():
+                self._send(200, {"status": "ready", **self.server.catalog_info})
+            elif self.server.load_error:
+                self._send(503, {"status": "failed", "error": self.server.load_error})
+            else:
+                self._send(503, {"status": "loading"})
+        else:
+            self._send(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self) -> None:
+        if self.path != "/recommend":
+            self._send(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # בלי אורך תקין אי אפשר לדעת איפה הגוף נגמר — rfile.read(-1) חוסם עד ניתוק
+            self.close_connection = True
+            self._send(400, {"error": "Invalid Content-Length"})
+            return
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send(413, {"error": "Request body too large"})
+            return
+        try:
+            answers = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send(400, {"error": "Body must be a JSON object of answers"})
+            return
+        if not isinstance(answers, dict):
+            self._send(400, {"error": "Body must be a JSON object of answers"})
+            return
+        if not self.server.ready.is_set():
+            self._send(503, {"error": "Catalog not loaded yet"})
+            return
+
+        try:
+            self._send(200, self.server.recommend(answers))
+        except FutureTimeout:
+            self._send(504, {"error": "Recommendation timed out"})
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+
+def main():
+    ap = argparse.ArgumentParser(description="CarMatch AI recommendation server.")
+    ap.add_argument("--catalog", default=os.getenv("CARMATCH_US_CATALOG", "data/catalog_us.parquet"))
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    ap.add_argument("--timeout", type=float, default=30.0, help="Seconds per /recommend request")
+    args = ap.parse_args()
+
+    server = RecommendationServer((args.host, args.port), args.catalog, args.workers, args.timeout)
+    server.start_preload()
+    print(f"CarMatch server on http://{args.host}:{server.server_port} (catalog {args.catalog}, {args.workers} workers)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
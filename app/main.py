@@ -15,10 +15,14 @@ for extra in [ROOT, PARENT, pathlib.Path.cwd()]:
         sys.path.append(p)
 
 try:
-    from agent.orchestrator import get_recommendations
+    from agent.orchestrator import get_recommendations, get_recommendations_progressive, get_similar
+    from matching.engine import RankingSession
     from agent.llm import chat_acknowledge, chat_clarify_no, chat_summary_funny, chat_explain_pick
 except Exception:
     from orchestrator import get_recommendations  # type: ignore
+    RankingSession = None  # type: ignore
+    get_similar = None  # type: ignore
+    get_recommendations_progressive = None  # type: ignore
     try:
         from llm import chat_acknowledge, chat_clarify_no, chat_summary_funny, chat_explain_pick  # type: ignore
     except Exception:
@@ -154,6 +158,29 @@ def _simple_recap(a: dict) -> str:
 
 TOP_SHOW = 3  # מציגים תמיד עד 3 תוצאות
 
+def _ranking_session():
+    # מצב דירוג לכל משתמש: תיקון תקציב/נוסעים/דלק מחשב מחדש רק את מה שהשתנה
+    if RankingSession is None:
+        return None
+    if "ranking_session" not in st.session_state:
+        st.session_state.ranking_session = RankingSession()
+    return st.session_state.ranking_session
+
+def render_similar(item, answers):
+    # "More like this" — שכנים קרובים לבחירה, בתוך אותם אילוצים (דלק/תקציב/מושבים)
+    if get_similar is None or item.get("vehicle_key") is None:
+        return
+    try:
+        similar = get_similar(item["vehicle_key"], k=3, answers=answers, catalog_path=CATALOG_PATH)["results"]
+    except Exception:
+        return
+    if similar:
+        st.markdown("**More like this:** " + " · ".join(
+            f"{s.get('year') or ''} {s.get('make')} {s.get('model')}".strip()
+            + (f" ({s['price_best']})" if s.get("price_best") else "")
+            for s in similar
+        ))
+
 # --------------- CHAT MODE -------------------
 if mode == "Chat":
     if "chat_messages" not in st.session_state:
@@ -355,19 +382,32 @@ if mode == "Chat":
         payload = dict(st.session_state.answers)
         payload["top_n"] = TOP_SHOW
 
-        result = get_recommendations(payload, catalog_path=CATALOG_PATH)
-        items = (result.get("results", []) or [])[:TOP_SHOW]
-
-        if puppeteer_only:
-            items = _filter_puppeteer_only(items)
-
-        for it in items:
-            src = str(it.get("price_source","")) or ""
-            fresh = _freshness_from_source(src)
-            if fresh and it.get("price_best"):
-                it["price_best"] = f"{it['price_best']} (as of {fresh})"
+        def _prepare_items(result):
+            items = (result.get("results", []) or [])[:TOP_SHOW]
+            if puppeteer_only:
+                items = _filter_puppeteer_only(items)
+            for it in items:
+                src = str(it.get("price_source","")) or ""
+                fresh = _freshness_from_source(src)
+                if fresh and it.get("price_best"):
+                    it["price_best"] = f"{it['price_best']} (as of {fresh})"
+            return items
+
+        # תשובה זמנית מוצגת מיד (בלי הסברי LLM), ומוחלפת כשהדירוג המלא מגיע
+        placeholder = st.empty()
+        if get_recommendations_progressive is not None:
+            for result in get_recommendations_progressive(payload, catalog_path=CATALOG_PATH, session=_ranking_session()):
+                if not result.get("final"):
+                    with placeholder.container():
+                        with st.chat_message("assistant"):
+                            st.caption("Quick first look — still checking the full catalog…")
+                            for i, it in enumerate(_prepare_items(result), start=1):
+                                st.markdown(f"**{i}. {it.get('year') or ''} {it.get('make')} {it.get('model')}** — score {as_score(it.get('score'))}")
+        else:
+            result = get_recommendations(payload, catalog_path=CATALOG_PATH, session=_ranking_session())
+        items = _prepare_items(result)
 
-        with st.chat_message("assistant"):
+        with placeholder.container(), st.chat_message("assistant"):
             if not items:
                 st.info("No vehicles matched your filters. Try relaxing constraints.")
             else:
@@ -385,6 +425,7 @@ if mode == "Chat":
                     explanation = chat_explain_pick(it, st.session_state.answers)
                     with st.expander("Why this pick?"):
                         st.markdown(explanation)
+                        render_similar(it, st.session_state.answers)
 
         st.session_state.results_shown = True
 
@@ -427,7 +468,7 @@ else:
         # advice banner פעם אחת גם ב-Form
         _advice_banner(answers)
 
-        result = get_recommendations(answers, catalog_path=CATALOG_PATH)
+        result = get_recommendations(answers, catalog_path=CATALOG_PATH, session=_ranking_session())
         items = (result.get("results", []) or [])[:TOP_SHOW]
 
         if puppeteer_only:
@@ -472,4 +513,5 @@ else:
             for i, it in enumerate(items[:TOP_SHOW], start=1):
                 explanation = chat_explain_pick(it, answers)
                 with st.expander(f"#{i} — {it.get('make')} {it.get('model')} (score {as_score(it.get('score'))})"):
-                    st.markdown(explanation)
\ No newline at end of file
+                    st.markdown(explanation)
+                    render_similar(it, answers)
\ No newline at end of file
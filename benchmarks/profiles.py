@@ -0,0 +1,18 @@
+# benchmarks/profiles.py
+# פרופילים מייצגים — כל אחד מפעיל נתיב אחר במנוע (תקציב, 6+ נוסעים, דלק, אמינות)
+from __future__ import annotations
+
+from typing import Any, Dict, List, Tuple
+
+from matching.engine import UserProfile
+
+PROFILES: List[Tuple[str, UserProfile, Dict[str, Any]]] = [
+    ("default", UserProfile(), {"top_n": 3}),
+    ("commuter_budget", UserProfile(usage="highway", passengers=2, annual_km=25000, budget=28000), {"top_n": 3}),
+    ("family_6plus", UserProfile(usage="mixed", passengers=7, budget=55000, prioritize_space=True), {"top_n": 3}),
+    ("city_ev", UserProfile(usage="city", passengers=4, budget=45000), {"top_n": 3, "fuel_type": "bev"}),
+    ("hybrid_long_term", UserProfile(passengers=5, budget=35000, ownership_years=8), {"top_n": 3, "fuel_type": "hybrid"}),
+    ("low_mileage_no_safety", UserProfile(annual_km=6000, prioritize_safety=False), {"top_n": 20}),
+    ("efficient_gas", UserProfile(passengers=4, budget=60000), {"top_n": 10, "fuel_type": "gas", "min_mpg": 30}),
+    ("diverse_wide", UserProfile(passengers=1), {"top_n": 50, "max_per_model": 2, "max_share_per_fuel": 0.4}),
+]
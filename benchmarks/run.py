@@ -0,0 +1,161 @@
+# benchmarks/run.py
+# מודד כל שלב במנוע בנפרד ושומר JSON להשוואה בין commits
+# הרצה:   python -m benchmarks.run --sizes 10k 100k 1M
+# השוואה: python -m benchmarks.run --sizes 10k --compare benchmarks/results/<old>.json
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.profiles import PROFILES
+from benchmarks.synthetic import SIZES, synthetic_catalog
+from matching.engine import UserProfile, preprocess_catalog, rank_cars
+from matching.filter_index import build_filter_index, filter_index
+from matching.timing import TIMINGS_ATTR
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def _summary(times: List[float]) -> Dict[str, Any]:
+    return {"best_ms": round(min(times), 3), "median_ms": round(statistics.median(times), 3), "runs": len(times)}
+
+
+def _timed(fn: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    times = []
+    out = None
+    for _ in range(max(1, repeat)):
+        t = time.perf_counter()
+        out = fn()
+        times.append((time.perf_counter() - t) * 1e3)
+    return {**_summary(times), "_out": out}
+
+
+def _stages(df: pd.DataFrame, profile: UserProfile, kw: Dict[str, Any], repeat: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Per-stage times of rank_cars itself (timings=True → attrs["stage_timings"]), so the split
+    follows the path rank_cars really takes (e.g. the budget filter before the components).
+    """
+    per_stage: Dict[str, List[float]] = {}
+    candidates: Dict[str, Any] = {}
+    totals = []
+    for _ in range(max(1, repeat)):
+        t = time.perf_counter()
+        out = rank_cars(profile, df, timings=True, **kw)
+        totals.append((time.perf_counter() - t) * 1e3)
+        for s in out.attrs[TIMINGS_ATTR]["stages"]:
+            per_stage.setdefault(s["stage"], []).append(s["ms"])
+            candidates[s["stage"]] = s["candidates"]
+
+    res = {stage: {**_summary(times), "candidates": candidates[stage]} for stage, times in per_stage.items()}
+    res["rank_cars"] = _summary(totals)
+    return res
+
+
+def run(sizes: List[str], repeat: int = 5, seed: int = 7, profiles: Optional[List[str]] = None) -> Dict[str, Any]:
+    results: List[Dict[str, Any]] = []
+    selected = [p for p in PROFILES if not profiles or p[0] in profiles]
+
+    def _record(rows: int, stage: str, profile: Optional[str], timing: Dict[str, Any]) -> None:
+        results.append({"rows": rows, "stage": stage, "profile": profile,
+                        **{k: v for k, v in timing.items() if not k.startswith("_")}})
+
+    for size in sizes:
+        rows = SIZES.get(size) or int(size)
+        raw = synthetic_catalog(rows, seed=seed)
+        prep = _timed(lambda: preprocess_catalog(raw), 1 if rows >= 500_000 else repeat)
+        df = prep["_out"]
+        _record(rows, "preprocess_catalog", None, prep)
+        _record(rows, "filter_index_build", None, _timed(lambda: build_filter_index(df), repeat))
+        filter_index(df)  # cache חם, כמו בשרת
+
+        for name, profile, kw in selected:
+            for stage, timing in _stages(df, profile, kw, repeat).items():
+                _record(rows, stage, name, timing)
+        print(f"  {size}: done ({rows:,} rows)")
+
+    return {"meta": _meta(), "config": {"sizes": sizes, "repeat": repeat, "seed": seed}, "results": results}
+
+
+def _meta() -> Dict[str, Any]:
+    def _git(*args: str) -> Optional[str]:
+        try:
+            return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+        except Exception:
+            return None
+
+    return {
+        "commit": _git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": dt.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "cpu_count": os.cpu_count(),
+        "platform": platform.platform(),
+    }
+
+
+def compare(new: Dict[str, Any], base: Dict[str, Any]) -> List[str]:
+    """Lines "rows stage profile: base → new (ratio)" for measurements present in both runs."""
+    def _key(r):
+        return (r["rows"], r["stage"], r["profile"])
+
+    old = {_key(r): r for r in base.get("results", [])}
+    lines = []
+    for r in new["results"]:
+        b = old.get(_key(r))
+        if b is None:
+            continue
+        ratio = b["median_ms"] / r["median_ms"] if r["median_ms"] else float("inf")
+        lines.append(
+            f"{r['rows']:>9,} {r['stage']:<20} {r['profile'] or '-':<22} "
+            f"{b['median_ms']:>10.2f} → {r['median_ms']:>10.2f} ms  ({ratio:.2f}x)"
+        )
+    return lines
+
+
+def main():
+    ap = argparse.ArgumentParser(description="CarMatch engine benchmarks (synthetic catalog).")
+    ap.add_argument("--sizes", nargs="+", default=list(SIZES), help="10k / 100k / 1M or a row count")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--profiles", nargs="*", default=None, help="Subset of benchmarks.profiles names")
+    ap.add_argument("--out", default=None, help="Default: benchmarks/results/<timestamp>-<commit>.json")
+    ap.add_argument("--compare", default=None, help="Previous results JSON to compare against")
+    args = ap.parse_args()
+
+    report = run(args.sizes, repeat=args.repeat, seed=args.seed, profiles=args.profiles)
+
+    out = args.out
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = dt.datetime.now().strftime("%Y%m%d-%H%M%S")
+        out = os.path.join(RESULTS_DIR, f"{stamp}-{report['meta']['commit'] or 'nogit'}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {out}")
+
+    for r in report["results"]:
+        if r["profile"] in (None, "default"):
+            print(f"{r['rows']:>9,} {r['stage']:<20} {r['profile'] or '-':<10} median {r['median_ms']:>10.2f} ms")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            base = json.load(f)
+        print(f"\nvs {args.compare} (commit {base.get('meta', {}).get('commit')}):")
+        for line in compare(report, base):
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# benchmarks/synthetic.py
+# קטלוג סינתטי עם הסכמה של data/catalog_us.parquet — להרצת benchmarks בלי הקובץ האמיתי
+from __future__ import annotations
+
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1M": 1_000_000}
+
+# (VClass, share, seats choices, base price) — תמהיל קרוב לקטלוג ה-EPA 2018–2026
+VCLASS_MIX: List[Tuple[str, float, List[int], float]] = [
+    ("Two Seaters", 0.03, [2], 62000),
+    ("Minicompact Cars", 0.02, [4], 45000),
+    ("Subcompact Cars", 0.07, [4, 5], 30000),
+    ("Compact Cars", 0.12, [5], 27000),
+    ("Midsize Cars", 0.14, [5], 33000),
+    ("Large Cars", 0.06, [5], 42000),
+    ("Small Station Wagons", 0.02, [5], 34000),
+    ("Small Sport Utility Vehicle 2WD", 0.08, [5], 31000),
+    ("Small Sport Utility Vehicle 4WD", 0.12, [5], 34000),
+    ("Standard Sport Utility Vehicle 2WD", 0.06, [5, 7], 45000),
+    ("Standard Sport Utility Vehicle 4WD", 0.12, [5, 7, 8], 52000),
+    ("Minivan - 2WD", 0.03, [7, 8], 40000),
+    ("Standard Pickup Trucks 4WD", 0.08, [5, 6], 50000),
+    ("Small Pickup Trucks 2WD", 0.02, [4, 5], 33000),
+    ("Vans, Passenger Type", 0.01, [12, 15], 52000),
+]
+
+# (fuelType, share, MPG mean, MPG sd)
+FUEL_MIX: List[Tuple[str, float, float, float]] = [
+    ("Regular", 0.52, 27.0, 5.5),
+    ("Premium", 0.22, 24.0, 4.5),
+    ("Diesel", 0.03, 27.0, 4.0),
+    ("Electricity", 0.11, 105.0, 18.0),
+    ("Regular Gas and Electricity", 0.05, 70.0, 15.0),
+    ("Premium and Electricity", 0.04, 60.0, 12.0),
+    ("Regular Gas or E85", 0.03, 19.0, 3.0),
+]
+
+MAKES: Dict[str, List[str]] = {
+    "Toyota": ["Camry", "Corolla", "RAV4", "Highlander", "Prius", "Sienna", "Tacoma", "bZ4X"],
+    "Honda": ["Civic", "Accord", "CR-V", "Pilot", "Odyssey", "Insight", "HR-V"],
+    "Ford": ["F150 Pickup", "Escape", "Explorer", "Mustang Mach-E", "Maverick", "Bronco"],
+    "Chevrolet": ["Silverado", "Equinox", "Tahoe", "Bolt EV", "Malibu", "Traverse"],
+    "Hyundai": ["Elantra", "Sonata", "Tucson", "Santa Fe", "Ioniq 5", "Kona"],
+    "Kia": ["Forte", "K5", "Sportage", "Sorento", "Telluride", "EV6", "Carnival"],
+    "Tesla": ["Model 3", "Model Y", "Model S", "Model X"],
+    "BMW": ["330i", "X3", "X5", "i4", "530e"],
+    "Lexus": ["ES 300h", "RX 350", "NX 450h+", "UX 250h"],
+    "Subaru": ["Outback", "Forester", "Crosstrek", "Ascent"],
+    "Volkswagen": ["Jetta", "Tiguan", "Atlas", "ID.4"],
+    "Mazda": ["Mazda3", "CX-5", "CX-50", "CX-90"],
+}
+
+TRANSMISSIONS = ["Auto (A1)", "Auto (A6)", "Auto (A8)", "Auto (S8)", "Auto (AV-S7)", "Manual (M6)", "Auto (S10)"]
+PRICE_SOURCES = ["msrp_est", "marketcheck", "puppeteer@2025-09-01"]
+
+
+def synthetic_catalog(rows: int, seed: int = 7, dup_share: float = 0.08) -> pd.DataFrame:
+    """
+    A catalog with the real column set and plausible distributions. About dup_share of the
+    rows repeat an earlier trim on every dedupe key (another year / price), like the real
+    multi-year catalog.
+    """
+    rng = np.random.default_rng(seed)
+    unique = max(1, int(round(rows * (1.0 - dup_share))))
+
+    vc_names = [v[0] for v in VCLASS_MIX]
+    vc_idx = rng.choice(len(VCLASS_MIX), unique, p=_probs([v[1] for v in VCLASS_MIX]))
+    fuel_idx = rng.choice(len(FUEL_MIX), unique, p=_probs([f[1] for f in FUEL_MIX]))
+    fuel = np.array([f[0] for f in FUEL_MIX], dtype=object)[fuel_idx]
+    mpg_mean = np.array([f[2] for f in FUEL_MIX])[fuel_idx]
+    mpg_sd = np.array([f[3] for f in FUEL_MIX])[fuel_idx]
+    mpg = np.clip(rng.normal(mpg_mean, mpg_sd), 10, 150).round()
+
+    make_names = list(MAKES)
+    make_idx = rng.integers(0, len(make_names), unique)
+    model = np.array([MAKES[make_names[i]][rng.integers(0, len(MAKES[make_names[i]]))] for i in make_idx], dtype=object)
+    # מספר הדגמים בקטלוג גדל עם הגודל שלו (listings) — מוסיפים סיומת דור
+    generation = rng.integers(0, max(1, unique // 2_000), unique)
+    model = np.where(generation > 0, model + " G" + generation.astype(str), model)
+
+    seats = np.array([rng.choice(VCLASS_MIX[i][2]) for i in vc_idx], dtype=float)
+    base_price = np.array([VCLASS_MIX[i][3] for i in vc_idx])
+    electric = np.char.find(fuel.astype(str), "Electric") >= 0
+    plug_in = electric & (np.char.find(fuel.astype(str), " and ") >= 0)
+    price = base_price * rng.lognormal(0.0, 0.22, unique) + np.where(electric, 6000, 0)
+    price = np.where(rng.random(unique) < 0.88, price.round(-2), np.nan)
+
+    frame = pd.DataFrame({
+        "year": rng.integers(2018, 2027, unique),
+        "make": np.array(make_names, dtype=object)[make_idx],
+        "model": model,
+        "option_text": rng.choice(TRANSMISSIONS, unique),
+        "VClass": np.array(vc_names, dtype=object)[vc_idx],
+        "fuelType": fuel,
+        "MPG_comb": mpg,
+        "overall_safety": rng.choice([3.0, 4.0, 5.0, np.nan], unique, p=[0.08, 0.3, 0.42, 0.2]),
+        "passengers": seats,
+        "Range_mi": np.where(electric & ~plug_in, rng.normal(270, 55, unique).round(), np.nan),
+        "electricRange_mi": np.where(plug_in, rng.normal(38, 12, unique).clip(10, 90).round(), np.nan),
+        "price_best": price,
+        "price_source": rng.choice(PRICE_SOURCES, unique, p=[0.7, 0.2, 0.1]),
+        "annual_fuel_cost": (15000 / np.maximum(mpg, 1) * 3.6).round(),
+        "recalls_count": rng.poisson(2.0, unique),
+        "complaints_count": rng.poisson(18.0, unique),
+    })
+    frame["has_market_price"] = frame["price_source"] != "msrp_est"
+
+    # כפילויות trim: אותו מפתח dedupe, שנה/מחיר אחרים
+    dups = frame.iloc[rng.integers(0, unique, rows - unique)].copy()
+    dups["year"] = rng.integers(2018, 2027, len(dups))
+    dups["price_best"] = dups["price_best"] * rng.uniform(0.9, 1.1, len(dups))
+    out = pd.concat([frame, dups], ignore_index=True)
+    return out.iloc[rng.permutation(len(out))].reset_index(drop=True)
+
+
+def _probs(weights: List[float]) -> np.ndarray:
+    w = np.asarray(weights, dtype=float)
+    return w / w.sum()
@@ -1,11 +1,19 @@
 # matching/engine.py
 from __future__ import annotations
 
-from dataclasses import dataclass, field
-from typing import List, Dict, Any, Optional
+from dataclasses import dataclass, field, replace
+from typing import Callable, List, Dict, Any, Optional, Tuple
 import pandas as pd
 import numpy as np
+import hashlib
+import json
 import os
+import re
+import tempfile
+import threading
+
+from matching.filter_index import DEDUPE_KEYS, filter_index
+from matching.timing import NULL_RECORDER, TIMINGS_ATTR, recorder
 
 # ---------------- Data model ----------------
 @dataclass
@@ -143,42 +151,230 @@ DEFAULT_WEIGHTS = {
     "usage": 0.10,
     # "reliability" יתווסף דינמית לפי ownership_years
 }
+# שמות הסליידרים ב-UI → מפתחות המשקל של המנוע (UserProfile.weights מקבל את שניהם)
+WEIGHT_ALIASES = {"efficiency": "mpg", "space": "passengers"}
 
 
 # ---------------- Catalog IO ----------------
-def load_catalog(path: str | None = None) -> pd.DataFrame:
+# גרסת הפורמט של הקטלוג המעובד — להעלות בכל שינוי ב-preprocess_catalog
+PREPARED_VERSION = 3  # 2: עמודת powertrain; 3: vehicle_key
+PREPARED_ROW_GROUP_SIZE = 65_536  # row groups קטנים = זיכרון חסום בקריאה בזרימה (rank_cars_streaming)
+PREPARED_ATTR = "carmatch_prepared"
+SOURCE_HASH_ATTR = "carmatch_source_hash"  # ה-hash של קובץ המקור שממנו נבנה ה-frame
+_PREPARED_META_KEY = b"carmatch.prepared"
+
+
+def catalog_content_hash(path: str) -> str:
+    """SHA-256 of the catalog file bytes (identifies a catalog build)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def prepared_catalog_path(path: str) -> str:
+    """data/catalog_us.parquet -> data/catalog_us.prepared.parquet"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.prepared{ext or '.parquet'}"
+
+
+def is_prepared(df: pd.DataFrame) -> bool:
+    return df.attrs.get(PREPARED_ATTR) == PREPARED_VERSION
+
+
+def _read_prepared_meta(prepared_path: str) -> Dict[str, Any]:
+    import pyarrow.parquet as pq
+    try:
+        meta = pq.read_schema(prepared_path).metadata or {}
+        return json.loads(meta.get(_PREPARED_META_KEY, b"{}"))
+    except Exception:
+        return {}
+
+
+def write_prepared_catalog(df: pd.DataFrame, prepared_path: str, source_hash: str) -> None:
+    """Writes a preprocessed frame with its version + source hash in the parquet metadata."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    meta = dict(table.schema.metadata or {})
+    meta[_PREPARED_META_KEY] = json.dumps(
+        {"version": PREPARED_VERSION, "source_hash": source_hash}
+    ).encode("utf-8")
+    # קובץ זמני לכל כותב — כמה workers יכולים לבנות מחדש באותו זמן בלי לדרוס זה את זה
+    fd, tmp = tempfile.mkstemp(
+        prefix=os.path.basename(prepared_path) + ".", suffix=".tmp", dir=os.path.dirname(prepared_path) or ".",
+    )
+    os.close(fd)
+    try:
+        pq.write_table(table.replace_schema_metadata(meta), tmp, row_group_size=PREPARED_ROW_GROUP_SIZE)
+        os.replace(tmp, prepared_path)  # לא משאירים קובץ חצי-כתוב לקוראים אחרים
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _read_parquet(path: str, columns: Optional[List[str]] = None, memory_map: bool = True) -> pd.DataFrame:
+    """pyarrow read that decodes only `columns` (those present in the file) via memory-mapped I/O."""
+    import pyarrow.parquet as pq
+
+    if columns is not None:
+        available = set(pq.read_schema(path).names)
+        columns = [c for c in dict.fromkeys(columns) if c in available]
+    table = pq.read_table(path, columns=columns, memory_map=memory_map)
+    return table.to_pandas()
+
+
+def load_prepared_catalog(
+    path: str,
+    columns: Optional[List[str]] = None,
+    memory_map: bool = True,
+) -> pd.DataFrame:
+    """
+    Loads the prepared artifact next to `path` if it matches the source hash and
+    PREPARED_VERSION; otherwise preprocesses the source and (best effort) rewrites it.
+    df.attrs[SOURCE_HASH_ATTR] is the hash of the source bytes the frame was built from.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    source_hash = catalog_content_hash(path)
+    prepared_path = prepared_catalog_path(path)
+    if os.path.exists(prepared_path):
+        meta = _read_prepared_meta(prepared_path)
+        if meta.get("version") == PREPARED_VERSION and meta.get("source_hash") == source_hash:
+            df = _read_parquet(prepared_path, columns, memory_map)
+            df.attrs[PREPARED_ATTR] = PREPARED_VERSION
+            df.attrs[SOURCE_HASH_ATTR] = source_hash
+            return df
+
+    # בנייה מחדש תמיד מהקובץ המלא, כדי שה-artifact יכיל את כל העמודות.
+    # קריאה אחת של הבתים — ה-hash וה-frame מאותם בתים גם אם הקובץ הוחלף בינתיים
+    with open(path, "rb") as f:
+        raw = f.read()
+    source_hash = hashlib.sha256(raw).hexdigest()
+    df = preprocess_catalog(pq.read_table(pa.BufferReader(raw)).to_pandas())
+    del raw
+    try:
+        write_prepared_catalog(df, prepared_path, source_hash)
+    except OSError:
+        pass  # תיקיית data לקריאה בלבד — פשוט נעבוד בלי ה-artifact
+    if columns is not None:
+        df = df[[c for c in dict.fromkeys(columns) if c in df.columns]]
+        df.attrs[PREPARED_ATTR] = PREPARED_VERSION
+    df.attrs[SOURCE_HASH_ATTR] = source_hash
+    return df
+
+
+def load_catalog(
+    path: str | None = None,
+    prepared: bool = False,
+    columns: Optional[List[str]] = None,
+    memory_map: bool = True,
+) -> pd.DataFrame:
+    """
+    Reads the catalog parquet. `columns` projects the read (missing names are ignored),
+    so e.g. raw_fe_json is never decoded; `prepared=True` returns the preprocessed frame.
+    """
     path = path or os.getenv("CARMATCH_US_CATALOG", "data/catalog_us.parquet")
     if not os.path.exists(path):
         raise FileNotFoundError(f"Catalog not found: {path}")
-    df = pd.read_parquet(path)
-    return df
+    if prepared:
+        return load_prepared_catalog(path, columns=columns, memory_map=memory_map)
+    return _read_parquet(path, columns, memory_map)
+
+
+# עמודות הקטלוג שהמנוע קורא (preprocess_catalog משלים חסרות ב-NaN)
+CATALOG_COLUMNS = [
+    "make", "model", "option_text", "VClass", "MPG_comb", "overall_safety",
+    "passengers", "fuelType", "Range_mi", "electricRange_mi",
+    # אופציונליים למחיר ועלות דלק:
+    "price_best", "price_source", "annual_fuel_cost",
+    # אופציונליים לאמינות:
+    "recalls_count", "complaints_count",
+    # אופציונלי: שנה
+    "year",
+]
+# עמודות שמחושבות ב-preprocess_catalog
+DERIVED_COLUMNS = [
+    "vclass_size", "mpg_norm", "safety_norm", "reliability_norm",
+    "is_phev", "is_bev", "is_hybrid", "powertrain",
+    "vehicle_key",
+]
+
+# הנעה — ערך יחיד לכל שורה (עדיפות: BEV > PHEV > diesel > HEV > ICE)
+POWERTRAINS = ["ICE", "HEV", "PHEV", "BEV", "diesel"]
+
+_LEXUS_H_PAT = re.compile(r"\b\d{2,4}h\b", re.IGNORECASE)
+
+
+def _map_unique(s: pd.Series, fn: Callable[[Any], Any], dtype: Any = float) -> np.ndarray:
+    """fn evaluated once per distinct value of s and broadcast back through the factorized codes."""
+    codes, uniques = pd.factorize(s, use_na_sentinel=False)
+    return np.asarray([fn(u) for u in uniques], dtype=dtype)[codes]
+
+
+def _row_texts(u: pd.DataFrame) -> pd.Series:
+    # "fuelType make model option_text" באותיות קטנות; str(v or "") כמו בגרסה שרצה שורה-שורה
+    cols = [[str(v or "") for v in u[c].tolist()] for c in ["fuelType", "make", "model", "option_text"]]
+    return pd.Series([" ".join(parts).lower() for parts in zip(*cols)], index=u.index, dtype=str)
+
+
+def _fuel_features(u: pd.DataFrame) -> pd.DataFrame:
+    """is_phev / is_bev / is_hybrid / powertrain for (fuelType, make, model, option_text) rows."""
+    texts = _row_texts(u)
+
+    # PHEV: מילות מפתח ברורות או שילוב Gas+Electric ב-fuelType
+    is_phev_kw = texts.str.contains(r"\bphev\b|plug[- ]?in", regex=True)
+    ft_str = u["fuelType"].astype(str)
+    is_phev_ft = ft_str.str.contains("Gas", case=False, na=False) & ft_str.str.contains("Electric", case=False, na=False)
+    is_phev = (is_phev_kw | is_phev_ft)
+
+    # BEV: Electric ללא Gas
+    is_bev = ft_str.str.contains("Electric", case=False, na=False) & ~ft_str.str.contains("Gas", case=False, na=False)
+
+    # HEV (non-plug): "hybrid" בשם/אופציה, או תבניות h של לקסוס, או דגמים מוכרים — אך לא PHEV
+    model_lower  = u["model"].astype(str).str.lower()
+    option_lower = u["option_text"].astype(str).str.lower()
+    hybrid_kw    = model_lower.str.contains("hybrid") | option_lower.str.contains("hybrid")
+    lexus_h      = model_lower.str.contains(_LEXUS_H_PAT) | option_lower.str.contains(_LEXUS_H_PAT)
+    known_hev    = model_lower.str.contains(r"\b(?:prius|insight|ioniq)\b", regex=True)
+    is_hybrid = (hybrid_kw | lexus_h | known_hev) & ~is_phev
+
+    # powertrain: כמו ה-bitmaps של filter_index, גם "Regular/Premium and Electricity" הם PHEV
+    electric = ft_str.str.contains("Electric", case=False, na=False).to_numpy(dtype=bool)
+    ice_syn = ft_str.str.contains("Gas|Regular|Premium", case=False, na=False).to_numpy(dtype=bool)
+    is_diesel = ft_str.str.contains("Diesel", case=False, na=False).to_numpy(dtype=bool)
+    flags = {
+        "is_phev": is_phev.to_numpy(dtype=bool),
+        "is_bev": is_bev.to_numpy(dtype=bool),
+        "is_hybrid": is_hybrid.to_numpy(dtype=bool),
+    }
+    flags["powertrain"] = np.select(
+        [electric & ~ice_syn, flags["is_phev"] | (electric & ice_syn), is_diesel, flags["is_hybrid"]],
+        ["BEV", "PHEV", "diesel", "HEV"],
+        default="ICE",
+    ).astype(object)
+    return pd.DataFrame(flags, index=u.index)
 
 
 def preprocess_catalog(df: pd.DataFrame) -> pd.DataFrame:
     df = df.copy()
-    expected = [
-        "make", "model", "option_text", "VClass", "MPG_comb", "overall_safety",
-        "passengers", "fuelType", "Range_mi", "electricRange_mi",
-        # אופציונליים למחיר ועלות דלק:
-        "price_best", "price_source", "annual_fuel_cost",
-        # אופציונליים לאמינות:
-        "recalls_count", "complaints_count",
-        # אופציונלי: שנה
-        "year",
-    ]
-    for col in expected:
+    for col in CATALOG_COLUMNS:
         if col not in df.columns:
             df[col] = np.nan
 
-    # גודל רכב לנוחות/שימוש
-    df["vclass_size"] = df["VClass"].map(_vclass_size_score)
+    # גודל רכב לנוחות/שימוש — פעם אחת לכל VClass שונה
+    df["vclass_size"] = _map_unique(df["VClass"], _vclass_size_score)
 
     # נורמליזציית יעילות פר דלק כדי לא לתת ל-EV לבלוע הכל
     fuel_key = df["fuelType"].fillna("unknown").astype(str)
     df["mpg_norm"] = df.groupby(fuel_key)["MPG_comb"].transform(lambda s: _robust_minmax(s))
 
     # בטיחות 0..1
-    df["safety_norm"] = df["overall_safety"].apply(_safety_to_numeric)
+    df["safety_norm"] = _map_unique(df["overall_safety"], _safety_to_numeric)
 
     # אמינות (פחות ריקולים/תלונות = יותר אמינות)
     rc = pd.to_numeric(df["recalls_count"], errors="coerce")
@@ -191,43 +387,92 @@ def preprocess_catalog(df: pd.DataFrame) -> pd.DataFrame:
         df["reliability_norm"] = 0.5
 
     # --- Robust fuel flags (to handle messy catalog labels) ---
-    import re
+    # הטקסטים והרגקסים רצים פעם אחת לכל צירוף (fuelType, make, model, option_text) שונה
+    text_cols = ["fuelType", "make", "model", "option_text"]
+    codes = df.groupby(text_cols, dropna=False, sort=False).ngroup().to_numpy()
+    _, first = np.unique(codes, return_index=True)
+    features = _fuel_features(df[text_cols].iloc[first])
+    for col in ["is_phev", "is_bev", "is_hybrid"]:
+        df[col] = features[col].to_numpy()[codes]
+    df["powertrain"] = pd.Categorical(features["powertrain"].to_numpy()[codes], categories=POWERTRAINS)
+
+    # מפתח רכב 64-bit — dedupe בבקשה הופך ל-unique על מספרים; גם מפתח קומפקטי ל-cache/לוגים
+    df["vehicle_key"] = _hash_vehicle_keys(df)
+
+    df.attrs[PREPARED_ATTR] = PREPARED_VERSION
+    return df
 
-    def _row_text(row):
-        parts = [
-            str(row.get("fuelType") or ""),
-            str(row.get("make") or ""),
-            str(row.get("model") or ""),
-            str(row.get("option_text") or "")
-        ]
-        return " ".join(parts).lower()
 
-    texts = df.apply(_row_text, axis=1)
+# ---------------- Serving view ----------------
+# עמודות ש-UI/orchestrator מציגים בנוסף למה שהמנוע קורא
+UI_COLUMNS = ["has_market_price"]
+SERVING_COLUMNS = CATALOG_COLUMNS + DERIVED_COLUMNS + UI_COLUMNS
 
-    # PHEV: מילות מפתח ברורות או שילוב Gas+Electric ב-fuelType
-    is_phev_kw = texts.str.contains(r"\bphev\b|plug[- ]?in", regex=True)
-    ft_str = df["fuelType"].astype(str)
-    is_phev_ft = ft_str.str.contains("Gas", case=False, na=False) & ft_str.str.contains("Electric", case=False, na=False)
-    df["is_phev"] = (is_phev_kw | is_phev_ft)
 
-    # BEV: Electric ללא Gas
-    df["is_bev"] = ft_str.str.contains("Electric", case=False, na=False) & ~ft_str.str.contains("Gas", case=False, na=False)
+def _float32_is_exact(x: np.ndarray) -> bool:
+    with np.errstate(over="ignore"):
+        return bool(np.array_equal(x.astype(np.float32).astype(np.float64), x, equal_nan=True))
 
-    # HEV (non-plug): "hybrid" בשם/אופציה, או תבניות h של לקסוס, או דגמים מוכרים — אך לא PHEV
-    model_lower  = df["model"].astype(str).str.lower()
-    option_lower = df["option_text"].astype(str).str.lower()
-    hybrid_kw    = model_lower.str.contains("hybrid") | option_lower.str.contains("hybrid")
-    lexus_h_pat  = re.compile(r"\b\d{2,4}h\b", re.IGNORECASE)
-    lexus_h      = model_lower.str.contains(lexus_h_pat) | option_lower.str.contains(lexus_h_pat)
-    known_hev    = model_lower.str.contains(r"\b(prius|insight|ioniq)\b", regex=True)
 
-    df["is_hybrid"] = (hybrid_kw | lexus_h | known_hev) & ~df["is_phev"]
+def _slim_series(s: pd.Series, max_category_ratio: float = 0.5) -> pd.Series:
+    if isinstance(s.dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(s):
+        return s
+    if pd.api.types.is_object_dtype(s) or pd.api.types.is_string_dtype(s):
+        if s.nunique(dropna=True) <= max(1, int(len(s) * max_category_ratio)):
+            return s.astype("category")
+        return s
+    if pd.api.types.is_integer_dtype(s):
+        if s.isna().any():  # Int64 עם חסרים
+            s = s.astype("float64")
+        else:
+            lo, hi = (s.min(), s.max()) if len(s) else (0, 0)
+            if np.iinfo(np.int16).min <= lo and hi <= np.iinfo(np.int16).max:
+                return s.astype(np.int16)
+            if np.iinfo(np.int32).min <= lo and hi <= np.iinfo(np.int32).max:
+                return s.astype(np.int32)
+            return s
+    if pd.api.types.is_float_dtype(s):
+        # רק אם float32 משחזר כל ערך במדויק — אחרת הציונים היו זזים
+        x = s.to_numpy(dtype=np.float64, na_value=np.nan)
+        if _float32_is_exact(x):
+            return s.astype(np.float32)
+    return s
+
+
+def slim_catalog(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Serving view of a prepared catalog: only the columns the engine and UI read,
+    repeated strings as categoricals, numerics downcast to float32/int16/int32 only
+    where every value survives the round trip (so scores are unchanged).
+    """
+    cols = [c for c in SERVING_COLUMNS if c in df.columns]
+    out = pd.DataFrame({c: _slim_series(df[c]) for c in cols}, index=df.index)
+    out.attrs.update(df.attrs)
+    return out
 
-    return df
+
+def catalog_footprint(df: pd.DataFrame) -> Dict[str, Any]:
+    """Deep memory usage of a frame: total bytes and bytes per column."""
+    per_col = df.memory_usage(deep=True, index=True)
+    return {
+        "rows": int(len(df)),
+        "total_bytes": int(per_col.sum()),
+        "columns": {str(k): int(v) for k, v in per_col.items()},
+    }
+
+
+def load_serving_catalog(path: str | None = None) -> pd.DataFrame:
+    """Prepared catalog reduced to the slim serving view (see slim_catalog)."""
+    return slim_catalog(load_catalog(path, prepared=True, columns=SERVING_COLUMNS))
 
 
 # ---------------- Scoring ----------------
 def _effective_weights(profile: UserProfile, df: pd.DataFrame) -> Dict[str, float]:
+    has_price = "price_best" in df.columns and df["price_best"].notna().any()
+    return _weights_for(profile, has_price=bool(has_price), has_reliability="reliability_norm" in df.columns)
+
+
+def _weights_for(profile: UserProfile, has_price: bool, has_reliability: bool) -> Dict[str, float]:
     w = DEFAULT_WEIGHTS.copy()
 
     # עדכוני עדיפויות משתמש
@@ -253,14 +498,19 @@ def _effective_weights(profile: UserProfile, df: pd.DataFrame) -> Dict[str, floa
         w["passengers"] += 0.10  # חיזקנו (היה 0.05)
 
     # תקציב רק אם יש גם מחיר וגם תקציב
-    has_price = "price_best" in df.columns and df["price_best"].notna().any()
     if has_price and profile.budget:
         w["budget"] = 0.20
 
     # אמינות רק אם מחזיקים לטווח ארוך (>=5 שנים)
-    if (profile.ownership_years or 0) >= 5 and "reliability_norm" in df.columns:
+    if (profile.ownership_years or 0) >= 5 and has_reliability:
         w["reliability"] = 0.15
 
+    # override ידני (סליידרים "what-if") — מחליף את המשקל המחושב לפני הנרמול; שלילי → 0
+    for key, value in (profile.weights or {}).items():
+        key = WEIGHT_ALIASES.get(str(key).lower(), str(key).lower())
+        if key in _WEIGHT_KEYS:
+            w[key] = max(0.0, float(value))
+
     # נרמול
     total = sum(w.values())
     for k in list(w.keys()):
@@ -376,70 +626,651 @@ def score_vehicle_row_v2(row: pd.Series, profile: UserProfile, weights: Dict[str
     return {"score": float(score), "reasons": reasons}
 
 
+# ---------------- Vectorized scoring ----------------
+# (weight key, component) — same order as the sum in score_vehicle_row_v2,
+# so the column-wise score is bit-for-bit identical to the per-row one.
+SCORE_COMPONENTS = [
+    ("passengers", "p_fit"),
+    ("mpg", "eff_norm"),
+    ("safety", "saf_norm"),
+    ("usage", "u_fit"),
+    ("budget", "b_fit"),
+    ("reliability", "rel_norm"),
+]
+# return_components=True: ערכי הרכיבים + המשקלים שהופעלו, כעמודות מספריות ליד reasons
+COMPONENT_COLUMNS = [comp for _, comp in SCORE_COMPONENTS]
+WEIGHT_COLUMNS = [f"w_{wkey}" for wkey, _ in SCORE_COMPONENTS]
+
+
+def _num(df: pd.DataFrame, col: str) -> np.ndarray:
+    if col not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+
+
+def _or_default(x: np.ndarray, default: float) -> np.ndarray:
+    # שקול ל-float(v or default): אפס מוחלף, NaN נשאר NaN
+    return np.where(x == 0, default, x)
+
+
+def _passenger_fit_array(capacity: np.ndarray, required: Any) -> np.ndarray:
+    cap = np.trunc(capacity)
+    req = np.maximum(required, 1)
+    with np.errstate(invalid="ignore"):
+        fit = np.where(
+            cap >= required,
+            np.minimum(1.0, 0.8 + 0.2 * (cap / req)),
+            np.maximum(0.0, cap / req),
+        )
+    return np.where(np.isfinite(cap), fit, 0.0)
+
+
+def _range_fit_array(rng: np.ndarray, min_ref: float, max_ref: float) -> np.ndarray:
+    return np.clip((rng - min_ref) / max(1e-9, (max_ref - min_ref)), 0.0, 1.0)
+
+
+def _fuel_flags(df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    fuel = df["fuelType"].astype(str).fillna("").str.lower()
+    has_elec = fuel.str.contains("electric", regex=False).to_numpy(dtype=bool)
+    has_gas = fuel.str.contains("gas", regex=False).to_numpy(dtype=bool)
+    return has_elec, has_gas
+
+
+def _efficiency_from(
+    mpg_norm: np.ndarray,
+    has_elec: np.ndarray,
+    has_gas: np.ndarray,
+    rng: np.ndarray,
+    elec: np.ndarray,
+) -> np.ndarray:
+    mpg_norm = _or_default(mpg_norm, 0.0)
+    bev = has_elec & ~has_gas & ~np.isnan(rng)
+    phev = has_gas & has_elec & ~np.isnan(elec)
+    with np.errstate(invalid="ignore"):
+        eff = np.where(bev, 0.7 * mpg_norm + 0.3 * _range_fit_array(rng, 150.0, 300.0), mpg_norm)
+        eff = np.where(phev, 0.85 * mpg_norm + 0.15 * _range_fit_array(elec, 20.0, 60.0), eff)
+    return eff
+
+
+def _efficiency_array(df: pd.DataFrame) -> np.ndarray:
+    has_elec, has_gas = _fuel_flags(df)
+    return _efficiency_from(_num(df, "mpg_norm"), has_elec, has_gas, _num(df, "Range_mi"), _num(df, "electricRange_mi"))
+
+
+def _usage_fit_array(vclass_size: np.ndarray, usage: str) -> np.ndarray:
+    u = (usage or "mixed").lower()
+    if u == "city":
+        return 1.0 - vclass_size
+    if u == "highway":
+        return vclass_size.copy()
+    return 1.0 - np.abs(vclass_size - 0.6)
+
+
+def _to_float_or_nan(x: Any) -> float:
+    try:
+        return float(x) if x is not None else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _budget_fit_array(price: np.ndarray, budget: Any) -> np.ndarray:
+    b = np.asarray(budget, dtype=float) if isinstance(budget, np.ndarray) else np.asarray(_to_float_or_nan(budget))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = price / b
+        over = (price - b) / b
+        fit = np.where(
+            price <= b,
+            np.clip(0.7 + 0.3 * ratio, 0.0, 1.0),
+            np.clip(0.8 - 1.6 * over, 0.0, 0.8),
+        )
+    return np.where(np.isnan(price) | np.isnan(b) | (b <= 0), 0.5, fit)
+
+
+_WEIGHT_KEYS = {wkey for wkey, _ in SCORE_COMPONENTS}
+
+
+def _combine_matrix(matrix: np.ndarray, weights: Dict[str, float]) -> np.ndarray:
+    """_combine_scores over a (rows × SCORE_COMPONENTS) matrix, one column per component."""
+    return _combine_scores({comp: matrix[:, j] for j, (_, comp) in enumerate(SCORE_COMPONENTS)}, weights)
+
+
+# העמודות הגולמיות שהניקוד הווקטורי קורא (has_elec/has_gas נגזרים מ-fuelType)
+SCORING_INPUTS = [
+    "passengers", "mpg_norm", "has_elec", "has_gas", "Range_mi", "electricRange_mi",
+    "safety_norm", "vclass_size", "price_best", "reliability_norm",
+]
+
+
+def _scoring_inputs(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    has_elec, has_gas = _fuel_flags(df)
+    inputs = {c: _num(df, c) for c in SCORING_INPUTS if c not in ("has_elec", "has_gas")}
+    inputs["has_elec"], inputs["has_gas"] = has_elec, has_gas
+    return inputs
+
+
+def _components_from_inputs(x: Dict[str, np.ndarray], profile: UserProfile) -> Dict[str, np.ndarray]:
+    size = _or_default(x["vclass_size"], 0.55)
+    return {
+        "p_fit": _passenger_fit_array(x["passengers"], profile.passengers),
+        "eff_norm": _efficiency_from(x["mpg_norm"], x["has_elec"], x["has_gas"], x["Range_mi"], x["electricRange_mi"]),
+        "saf_norm": _or_default(x["safety_norm"], 0.0),
+        "u_fit": _usage_fit_array(size, profile.usage),
+        "b_fit": _budget_fit_array(x["price_best"], profile.budget),
+        "rel_norm": _or_default(x["reliability_norm"], 0.5),
+    }
+
+
+def _score_components(df: pd.DataFrame, profile: UserProfile) -> Dict[str, np.ndarray]:
+    """Column-wise equivalent of the numeric part of score_vehicle_row_v2."""
+    return _components_from_inputs(_scoring_inputs(df), profile)
+
+
+def _combine_scores(components: Dict[str, np.ndarray], weights: Dict[str, float]) -> np.ndarray:
+    score = None
+    for wkey, comp in SCORE_COMPONENTS:
+        term = weights.get(wkey, 0.0) * components[comp]
+        score = term if score is None else score + term
+    return score
+
+
 # ---------------- Post-processing ----------------
-def _dedupe_rows(df: pd.DataFrame) -> pd.DataFrame:
-    keys = [c for c in ["make", "model", "option_text", "VClass", "fuelType", "MPG_comb", "overall_safety", "passengers"] if c in df.columns]
-    return df.drop_duplicates(subset=keys)
+def _dedupe_keys(df: pd.DataFrame) -> List[str]:
+    return [c for c in DEDUPE_KEYS if c in df.columns]
 
 
-def _diversify(
-    df_sorted: pd.DataFrame,
+def vehicle_keys(df: pd.DataFrame) -> np.ndarray:
+    """
+    64-bit identity of each row's DEDUPE_KEYS values (uint64). Prepared catalogs carry it as
+    the vehicle_key column; other frames are hashed on the fly (same values).
+    """
+    if "vehicle_key" in df.columns:
+        return df["vehicle_key"].to_numpy(dtype=np.uint64)
+    return _hash_vehicle_keys(df)
+
+
+def _hash_vehicle_keys(df: pd.DataFrame) -> np.ndarray:
+    # לא תלוי ב-dtypes — ה-serving view (קטגוריות / float32) מקבל אותם מפתחות כמו הקטלוג המלא
+    cols = {}
+    for c in _dedupe_keys(df):
+        s = df[c]
+        if pd.api.types.is_numeric_dtype(s) and not isinstance(s.dtype, pd.CategoricalDtype):
+            cols[c] = pd.to_numeric(s, errors="coerce").astype("float64")
+        else:
+            # ערכים ייחודיים → קטגוריות מחרוזת (object); hash לפי קטגוריה, לא לפי שורה.
+            # מחרוזת לפני factorize: 5 ו-"5" (NHTSA מחזיר דירוג כמחרוזת) = קטגוריה אחת; NaN נשאר NA
+            codes, uniques = pd.factorize(s.astype(str).where(s.notna()))
+            categories = pd.Index(np.asarray(uniques, dtype=object), dtype=object)
+            cols[c] = pd.Categorical.from_codes(codes, categories=categories)
+    return pd.util.hash_pandas_object(pd.DataFrame(cols, index=df.index), index=False).to_numpy(dtype=np.uint64)
+
+
+def _factor_codes(df: pd.DataFrame, col: str, lower: bool = False, empty_as: Optional[str] = None) -> np.ndarray:
+    if col not in df.columns:
+        return np.zeros(len(df), dtype=np.int64)
+    s = df[col].astype(str).str.strip()
+    if lower:
+        s = s.str.lower()
+    if empty_as is not None:
+        s = s.mask(s == "", empty_as)
+    codes, _ = pd.factorize(s, use_na_sentinel=False)
+    return codes.astype(np.int64)
+
+
+def _diversity_codes(df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """(make, model) and fuel codes, keyed like the strings the greedy re-ranker compares."""
+    make = _factor_codes(df, "make")
+    model = _factor_codes(df, "model")
+    model_key = make * (int(model.max(initial=0)) + 1) + model
+    fuel = _factor_codes(df, "fuelType", lower=True, empty_as="unknown")
+    return model_key, fuel
+
+
+def _diversify_positions(
+    model_codes: np.ndarray,
+    fuel_codes: np.ndarray,
     top_n: int,
     max_per_model: int = 1,
     max_share_per_fuel: float = 0.7,
-) -> pd.DataFrame:
-    """Greedy re-ranker to enforce diversity by model and fuel type."""
-    selected_idx: list[int] = []
-    model_counts: Dict[tuple[str, str], int] = {}
-    fuel_counts: Dict[str, int] = {}
-
-    def can_take(row: pd.Series) -> bool:
-        mk = str(row.get("make", "")).strip()
-        md = str(row.get("model", "")).strip()
-        key = (mk, md)
-        model_ok = model_counts.get(key, 0) < max_per_model
-
-        fuel = str(row.get("fuelType", "unknown")).strip().lower() or "unknown"
-        current_total = len(selected_idx)
-        fuel_ok = True
-        if current_total + 1 > 0:
-            projected = fuel_counts.get(fuel, 0) + 1
-            fuel_ok = (projected / (current_total + 1)) <= max_share_per_fuel
-
-        return model_ok and fuel_ok
-
-    # First pass
-    for idx, row in df_sorted.iterrows():
-        if len(selected_idx) >= top_n:
+    chunk: int = 256,
+) -> List[int]:
+    """
+    Greedy diversity selection over codes in ranked order; returns positions.
+    Reads the ranking in chunks and stops as soon as top_n rows are picked.
+    """
+    selected: List[int] = []
+    taken: set[int] = set()
+    model_counts: Dict[int, int] = {}
+    fuel_counts: Dict[int, int] = {}
+    n = len(model_codes)
+
+    def _ranked():
+        for start in range(0, n, chunk):
+            stop = min(start + chunk, n)
+            yield from zip(range(start, stop), model_codes[start:stop].tolist(), fuel_codes[start:stop].tolist())
+
+    # First pass: model cap + fuel share cap.
+    # כשהרשימה ריקה הנתח הצפוי הוא 1/1, ולכן עם max_share_per_fuel < 1 המעבר הזה
+    # לא יכול לבחור אף שורה — מדלגים עליו במקום לסרוק את כל הדירוג לשווא.
+    first_pass = _ranked() if max_share_per_fuel >= 1.0 else ()
+    for i, m, f in first_pass:
+        if len(selected) >= top_n:
             break
-        if can_take(row):
-            selected_idx.append(idx)
-            mk = str(row.get("make", "")).strip()
-            md = str(row.get("model", "")).strip()
-            model_counts[(mk, md)] = model_counts.get((mk, md), 0) + 1
-            fuel = str(row.get("fuelType", "unknown")).strip().lower() or "unknown"
-            fuel_counts[fuel] = fuel_counts.get(fuel, 0) + 1
+        if model_counts.get(m, 0) >= max_per_model:
+            continue
+        if (fuel_counts.get(f, 0) + 1) / (len(selected) + 1) > max_share_per_fuel:
+            continue
+        selected.append(i)
+        taken.add(i)
+        model_counts[m] = model_counts.get(m, 0) + 1
+        fuel_counts[f] = fuel_counts.get(f, 0) + 1
 
     # Second pass (relax fuel)
-    if len(selected_idx) < top_n:
-        for idx, row in df_sorted.iterrows():
-            if len(selected_idx) >= top_n:
+    if len(selected) < top_n:
+        for i, m, _ in _ranked():
+            if len(selected) >= top_n:
                 break
-            if idx in selected_idx:
+            if i in taken:
                 continue
-            mk = str(row.get("make", "")).strip()
-            md = str(row.get("model", "")).strip()
-            key = (mk, md)
-            if model_counts.get(key, 0) < max_per_model:
-                selected_idx.append(idx)
-                model_counts[key] = model_counts.get(key, 0) + 1
+            if model_counts.get(m, 0) < max_per_model:
+                selected.append(i)
+                taken.add(i)
+                model_counts[m] = model_counts.get(m, 0) + 1
+
+    return selected
+
+
+def _rank_order(score: np.ndarray, safety: np.ndarray, mpg: np.ndarray) -> np.ndarray:
+    """
+    Positions sorted by (score, overall_safety, MPG_comb) descending, NaN last, ties stable —
+    the same order as sort_values(..., ascending=[False, False, False]).
+    """
+    def _desc(x):
+        return np.where(np.isnan(x), np.inf, -x)
+    return np.lexsort((_desc(mpg), _desc(safety), _desc(score)))
+
+
+RANK_PREFIX_MIN = 1024
+
+
+def _rank_prefix(score: np.ndarray, safety: np.ndarray, mpg: np.ndarray, k: int) -> np.ndarray:
+    """
+    At least the first k positions of _rank_order: every row scoring >= the k-th best score
+    (boundary ties included), sorted — a prefix of the full order without sorting all rows.
+    """
+    n = len(score)
+    if k >= n or np.isnan(score).any():
+        return _rank_order(score, safety, mpg)
+    threshold = np.partition(score, n - k)[n - k]
+    head = np.flatnonzero(score >= threshold)
+    return head[_rank_order(score[head], safety[head], mpg[head])]
+
+
+def _select_diverse(
+    score: np.ndarray,
+    safety: np.ndarray,
+    mpg: np.ndarray,
+    model_codes: np.ndarray,
+    fuel_codes: np.ndarray,
+    top_n: int,
+    max_per_model: int,
+    max_share_per_fuel: float,
+    rec: Any = NULL_RECORDER,
+) -> np.ndarray:
+    """Ranks candidates and returns the diversified positions (in output order)."""
+    # הבחירה החמדנית קוראת רק התחלה של הדירוג; ממיינים את כולו רק אם ההתחלה לא הספיקה
+    order = _rank_prefix(score, safety, mpg, max(RANK_PREFIX_MIN, 16 * top_n * max(1, max_per_model)))
+    rec.mark("sort", order)
+    picks = _diversify_positions(model_codes[order], fuel_codes[order], top_n, max_per_model, max_share_per_fuel)
+    rec.mark("diversify", len(picks))
+    if len(picks) < top_n and len(order) < len(score):
+        order = _rank_order(score, safety, mpg)
+        rec.mark("sort", order)
+        picks = _diversify_positions(model_codes[order], fuel_codes[order], top_n, max_per_model, max_share_per_fuel)
+        rec.mark("diversify", len(picks))
+    if not picks:
+        return order[:top_n]
+    return order[picks]
+
+
+RESULT_COLUMNS = [
+    "year",
+    "make", "model", "option_text", "VClass", "fuelType",
+    "passengers", "MPG_comb", "overall_safety", "Range_mi", "electricRange_mi",
+    "price_best", "price_source", "annual_fuel_cost",
+    "score", "reasons",
+]
+REASON_INPUT_COLUMNS = [
+    "mpg_norm", "safety_norm", "vclass_size", "reliability_norm",
+    "recalls_count", "complaints_count",
+]
+
+
+def _finalize_ranked(
+    df: pd.DataFrame,
+    rows: np.ndarray,
+    score: np.ndarray,
+    profile: UserProfile,
+    weights: Dict[str, float],
+    return_components: bool = False,
+) -> pd.DataFrame:
+    # רק העמודות לפלט + מה ש-score_vehicle_row_v2 קורא לצורך ההסברים
+    cols = [c for c in RESULT_COLUMNS + REASON_INPUT_COLUMNS if c in df.columns and c not in ("score", "reasons")]
+    # קודם שורות ואז עמודות: iloc[rows, cols] על frame גדול מעתיק עמודות שלמות
+    out = df.iloc[rows][cols].assign(score=score[rows]).reset_index(drop=True)
+
+    # הסברים (מחרוזות) רק לשורות שנבחרו בפועל
+    out["reasons"] = [score_vehicle_row_v2(row, profile, weights)["reasons"] for _, row in out.iterrows()]
+
+    existing_keep = [c for c in RESULT_COLUMNS if c in out.columns]
+    out = out[existing_keep]
+    if return_components:
+        out = _with_components(out, df.iloc[rows], profile, weights)
+    return out
+
+
+def _with_components(out: pd.DataFrame, picked: pd.DataFrame, profile: UserProfile, weights: Dict[str, float]) -> pd.DataFrame:
+    """Appends COMPONENT_COLUMNS (vectorized, picked rows only) and the applied WEIGHT_COLUMNS."""
+    comps = _score_components(picked, profile)
+    extra = {comp: comps[comp] for comp in COMPONENT_COLUMNS}
+    extra.update({f"w_{wkey}": np.full(len(out), weights.get(wkey, 0.0)) for wkey, _ in SCORE_COMPONENTS})
+    return out.assign(**extra)
+
+
+# ---------------- Hard filters ----------------
+def _seating_mask(df: pd.DataFrame, passengers: Optional[int], prioritize_space: bool) -> np.ndarray:
+    idx = filter_index(df)
+    if (passengers or 0) >= 6:
+        # דרישה ל-6+ מושבים: נרכך לסף ≥5 כדי לא לחסום נתונים חסרים,
+        # ואז נוציא "Cars" כדי להסיר סדאנים/קופה (משאיר SUV/Minivan/Van/Wagon).
+        return idx.seats_at_least(5) & ~idx.car_class
+    # דרישה רגילה: לפחות כמספר הנוסעים (קשיח), כדי למנוע רכב קטן מדי.
+    mask = idx.seats_at_least(max(1, int(passengers or 1)))
+    # ל-≤5 נוסעים (ואין עדיפות מרחב) — לא להמליץ על Van/Minivan/Pickup/Truck
+    if not prioritize_space:
+        mask = mask & ~idx.utility_class
+    return mask
+
+
+def _fuel_mask(df: pd.DataFrame, fuel_type: Optional[str]) -> np.ndarray:
+    ft = (str(fuel_type or "")).strip().lower()
+    fuel = filter_index(df).fuel
+    if ft in fuel:
+        return fuel[ft]
+    return np.ones(len(df), dtype=bool)
+
+
+def _static_mask(df: pd.DataFrame, min_mpg: Optional[float], fuel_type: Optional[str]) -> np.ndarray:
+    """Profile-independent hard filters: min_mpg and fuel_type."""
+    mask = np.ones(len(df), dtype=bool)
+    if min_mpg is not None and "MPG_comb" in df.columns:
+        mask &= filter_index(df).mpg_at_least(min_mpg)
+    if fuel_type:
+        mask &= _fuel_mask(df, fuel_type)
+    return mask
+
+
+def _dedupe_positions(df: pd.DataFrame, positions: np.ndarray) -> np.ndarray:
+    """
+    Same rows as df.iloc[positions].drop_duplicates(_dedupe_keys(df)) for hard-filtered
+    positions, as positions into df: the filters read only dedupe-key columns, so a group's
+    first row passes iff any does.
+    """
+    return positions[filter_index(df).first_occurrence[positions]]
+
 
-    if not selected_idx:
-        return df_sorted.head(top_n).reset_index(drop=True)
-    return df_sorted.loc[selected_idx].reset_index(drop=True)
+def _candidate_positions(
+    df: pd.DataFrame,
+    profile: UserProfile,
+    min_mpg: Optional[float],
+    fuel_type: Optional[str],
+    rec: Any = NULL_RECORDER,
+) -> np.ndarray:
+    """Seating + mpg/fuel hard filters and dedupe (everything before the budget filter)."""
+    mask = _seating_mask(df, profile.passengers, profile.prioritize_space)
+    mask = mask & _static_mask(df, min_mpg, fuel_type)
+    rec.mark("filter", mask)
+    pos = _dedupe_positions(df, np.flatnonzero(mask))
+    rec.mark("dedupe", pos)
+    return pos
+
+
+def _pareto_prune(df: pd.DataFrame, pos: np.ndarray, profile: UserProfile, depth: int, rec: Any = NULL_RECORDER) -> np.ndarray:
+    """
+    Drops candidates dominated by more than `depth` rows of their group (matching.pareto).
+    depth >= max_per_model - 1 leaves the ranking unchanged. Skipped when the budget term is
+    active: under the budget the fit rises with price, so price is not a dominance dim.
+    """
+    if profile.budget and filter_index(df).has_price[pos].any():
+        return pos
+    from matching.pareto import dominance_counts  # import מקומי — pareto מייבא את engine
+
+    pos = pos[dominance_counts(df)[pos] <= depth]
+    rec.mark("pareto", pos)
+    return pos
 
 
 # ---------------- Public API ----------------
+class RankingSession:
+    """
+    Per-user ranking state for incremental re-ranks (e.g. a chat correction of one answer).
+    Every stage is cached together with the inputs it reads, so a new call recomputes only
+    what the changed field touches:
+
+        passengers / prioritize_space / min_mpg / fuel_type → candidate set + all components
+        usage  → u_fit
+        budget → price range filter + b_fit
+        weights, score sum, sort/diversify, reasons → always (cheap; O(candidates))
+
+    rerank(weights) repeats the last call with only profile.weights changed (what-if sliders).
+
+    rank() returns exactly what rank_cars() returns for the same arguments. A different
+    catalog object resets the state.
+
+    reuse=False (the throwaway session behind rank_cars): nothing is kept for a next call, so
+    the budget filter runs before the candidate frame and components are built.
+    """
+
+    def __init__(self, reuse: bool = True) -> None:
+        self._reuse = reuse
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, catalog: Optional[pd.DataFrame]) -> None:
+        self._catalog = catalog
+        self._df: Optional[pd.DataFrame] = None
+        self._base_key: Optional[tuple] = None
+        self._base: Dict[str, Any] = {}
+        self._usage_key: Optional[str] = None
+        self._budget_key: Any = None
+        self._last: Optional[Tuple[UserProfile, pd.DataFrame, Dict[str, Any]]] = None
+        self.stage_runs: Dict[str, int] = {"prepare": 0, "candidates": 0, "usage": 0, "budget": 0}
+
+    def _prepared(self, catalog: pd.DataFrame) -> pd.DataFrame:
+        if catalog is not self._catalog or self._df is None:
+            self._reset(catalog)
+            # קטלוג שכבר עבר preprocess (load_catalog(prepared=True)) לא מעובד שוב
+            self._df = catalog if is_prepared(catalog) else preprocess_catalog(catalog)
+            self.stage_runs["prepare"] += 1
+        return self._df
+
+    def _candidates(
+        self,
+        df: pd.DataFrame,
+        profile: UserProfile,
+        min_mpg: Optional[float],
+        fuel_type: Optional[str],
+        rec: Any = NULL_RECORDER,
+        pareto_depth: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        key = (profile.passengers, bool(profile.prioritize_space), min_mpg, fuel_type)
+        if pareto_depth is not None:
+            key += (pareto_depth, bool(profile.budget))  # הגיזום תלוי בשאלה אם יש תקציב
+        if key == self._base_key:
+            rec.mark("candidates_cached", self._base["pos"])
+            return self._base
+
+        # ---- Seating filters (חוקים רכים/קשיחים) + mpg / fuel hard filters + dedupe ----
+        pos = _candidate_positions(df, profile, min_mpg, fuel_type, rec)
+        if pareto_depth is not None:
+            pos = _pareto_prune(df, pos, profile, pareto_depth, rec)
+        has_price = bool(filter_index(df).has_price[pos].any())
+        prefiltered = not self._reuse and has_price and bool(profile.budget)
+        if prefiltered:
+            # חד-פעמי: רק שורות בטווח התקציב נכנסות ל-frame ולניקוד
+            pos = pos[filter_index(df).price_at_most(profile.budget)[pos]]
+
+        base = df.iloc[pos]
+        model_codes, fuel_codes = _diversity_codes(base)
+        # רכיבים שתלויים רק במועמדים (ובמספר הנוסעים, שהוא חלק מהמפתח)
+        components = {
+            "p_fit": _passenger_fit_array(_num(base, "passengers"), profile.passengers),
+            "eff_norm": _efficiency_array(base),
+            "saf_norm": _or_default(_num(base, "safety_norm"), 0.0),
+            "rel_norm": _or_default(_num(base, "reliability_norm"), 0.5),
+        }
+        self._base = {
+            "pos": pos,
+            "frame": base,
+            "has_price": has_price,            # לפני סינון התקציב — קובע את משקל b_fit
+            "prefiltered": prefiltered,
+            "price": _num(base, "price_best"),
+            "size": _or_default(_num(base, "vclass_size"), 0.55),
+            "safety": _num(base, "overall_safety"),
+            "mpg": _num(base, "MPG_comb"),
+            "model_codes": model_codes,
+            "fuel_codes": fuel_codes,
+            "components": components,
+        }
+        self._base_key = key
+        self._usage_key = self._budget_key = None
+        self.stage_runs["candidates"] += 1
+        rec.mark("components", pos)
+        return self._base
+
+    def _update_usage(self, base: Dict[str, Any], usage: str) -> None:
+        if usage != self._usage_key:
+            base["components"]["u_fit"] = _usage_fit_array(base["size"], usage)
+            base["ranked"] = None
+            self._usage_key = usage
+            self.stage_runs["usage"] += 1
+
+    def _update_budget(self, df: pd.DataFrame, base: Dict[str, Any], budget: Any, has_price: bool) -> None:
+        key = (budget, has_price)
+        if key == self._budget_key:
+            return
+        # Budget hard filter — טווח מחירים מהאינדקס הממוין
+        in_range = np.ones(len(base["pos"]), dtype=bool)
+        if has_price and budget and not base["prefiltered"]:
+            in_range = filter_index(df).price_at_most(budget)[base["pos"]]
+        base["rows"] = np.flatnonzero(in_range)
+        base["components"]["b_fit"] = _budget_fit_array(base["price"], budget)
+        base["ranked"] = None
+        self._budget_key = key
+        self.stage_runs["budget"] += 1
+
+    def _ranked_inputs(self, base: Dict[str, Any]) -> Dict[str, np.ndarray]:
+        """Component matrix + sort/diversity inputs of the in-budget rows; rebuilt when usage/budget change."""
+        if base.get("ranked") is None:
+            rows = base["rows"]
+            base["ranked"] = {
+                # column-major: _combine_matrix קורא עמודה שלמה בכל צעד
+                "matrix": np.stack([base["components"][comp][rows] for comp in COMPONENT_COLUMNS]).T,
+                "safety": base["safety"][rows],
+                "mpg": base["mpg"][rows],
+                "model_codes": base["model_codes"][rows],
+                "fuel_codes": base["fuel_codes"][rows],
+            }
+        return base["ranked"]
+
+    def rerank(self, weights: Dict[str, float], timings: bool = False) -> pd.DataFrame:
+        """
+        The last rank() call again with profile.weights replaced ("what-if" priority sliders).
+        Only the weighted sum, sort/diversify and the top_n reasons run — the candidate set,
+        its component matrix and the budget filter are reused.
+        """
+        if self._last is None:
+            raise RuntimeError("rerank() needs a previous rank() call")
+        profile, catalog, kwargs = self._last
+        return self.rank(replace(profile, weights=dict(weights)), catalog, timings=timings, **kwargs)
+
+    def rank(
+        self,
+        profile: UserProfile,
+        catalog: pd.DataFrame,
+        top_n: int = 20,
+        min_mpg: Optional[float] = None,
+        max_per_model: int = 1,
+        max_share_per_fuel: float = 0.7,
+        fuel_type: Optional[str] = None,
+        timings: bool = False,
+        return_components: bool = False,
+        pareto_slack: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """timings=True adds per-stage times/counts as out.attrs["stage_timings"] (see matching.timing)."""
+        rec = recorder(timings)
+        with self._lock:
+            out = self._rank(
+                rec, profile, catalog, top_n, min_mpg, max_per_model, max_share_per_fuel, fuel_type, return_components,
+                pareto_slack,
+            )
+            self._last = (profile, catalog, dict(
+                top_n=top_n, min_mpg=min_mpg, max_per_model=max_per_model, max_share_per_fuel=max_share_per_fuel,
+                fuel_type=fuel_type, return_components=return_components, pareto_slack=pareto_slack,
+            ))
+        return _with_timings(out, rec, timings)
+
+    def _rank(
+        self,
+        rec: Any,
+        profile: UserProfile,
+        catalog: pd.DataFrame,
+        top_n: int,
+        min_mpg: Optional[float],
+        max_per_model: int,
+        max_share_per_fuel: float,
+        fuel_type: Optional[str],
+        return_components: bool = False,
+        pareto_slack: Optional[int] = None,
+    ) -> pd.DataFrame:
+        df = self._prepared(catalog)
+        rec.mark("prepare", len(df))
+        depth = None if pareto_slack is None else max(0, int(max_per_model) - 1 + int(pareto_slack))
+        base = self._candidates(df, profile, min_mpg, fuel_type, rec, depth)
+        pos = base["pos"]
+        if not len(pos) and not base["prefiltered"]:
+            return df.iloc[pos]
+        # התקציב החד-פעמי רוקן את הסט — ממשיכים עם 0 שורות כדי לשמור על סכמת התוצאה
+
+        has_price = base["has_price"]
+        self._update_usage(base, (profile.usage or "mixed").lower())
+        self._update_budget(df, base, profile.budget, has_price)
+        rows = base["rows"]
+        ranked = self._ranked_inputs(base)
+        rec.mark("budget", rows)
+
+        weights = _weights_for(profile, has_price=has_price, has_reliability="reliability_norm" in df.columns)
+        score_rows = _combine_matrix(ranked["matrix"], weights)
+        rec.mark("score", rows)
+
+        # Sort + diversify על מערכים; רק השורות שנבחרו נשלפות מה-DataFrame
+        picks = _select_diverse(
+            score_rows, ranked["safety"], ranked["mpg"], ranked["model_codes"], ranked["fuel_codes"],
+            top_n, max_per_model, max_share_per_fuel, rec,
+        )
+        score = np.empty(len(pos))
+        score[rows[picks]] = score_rows[picks]
+        out = _finalize_ranked(base["frame"], rows[picks], score, profile, weights, return_components)
+        rec.mark("finalize", len(out))
+        return out
+
+
+def _with_timings(out: pd.DataFrame, rec: Any, attach: bool) -> pd.DataFrame:
+    timings = rec.finish()  # קורא ל-hook של stage_timing אם פעיל
+    if attach and timings is not None:
+        out.attrs[TIMINGS_ATTR] = timings.as_dict()
+    return out
+
+
 def rank_cars(
     profile: UserProfile,
     catalog: pd.DataFrame,
@@ -448,83 +1279,221 @@ def rank_cars(
     max_per_model: int = 1,
     max_share_per_fuel: float = 0.7,
     fuel_type: Optional[str] = None,   # optional extra filter ("gas"/"bev"/"phev"/"any")
+    workers: Optional[int] = None,     # >1: ניקוד מפוצל בין תהליכים (matching.parallel)
+    timings: bool = False,             # זמני שלבים ב-out.attrs["stage_timings"]
+    return_components: bool = False,   # + עמודות p_fit..rel_norm ו-w_* (בלי לפרסר את reasons)
+    pareto_slack: Optional[int] = None,  # גיזום רכבים נשלטים לפני הניקוד; 0 = מינימום שעדיין זהה
 ) -> pd.DataFrame:
-    df = preprocess_catalog(catalog)
+    if workers is not None and workers > 1:
+        from matching.parallel import rank_cars_sharded  # import מקומי — parallel מייבא את engine
+
+        df = catalog if is_prepared(catalog) else preprocess_catalog(catalog)
+        return rank_cars_sharded(
+            profile, df, workers, top_n=top_n, min_mpg=min_mpg, max_per_model=max_per_model,
+            max_share_per_fuel=max_share_per_fuel, fuel_type=fuel_type, timings=timings,
+            return_components=return_components, pareto_slack=pareto_slack,
+        )
+    # ריצה חד-פעמית = סשן טרי; שיחות צ'אט מחזיקות RankingSession משלהן לדירוג חוזר מהיר
+    return RankingSession(reuse=False).rank(
+        profile, catalog, top_n=top_n, min_mpg=min_mpg, max_per_model=max_per_model,
+        max_share_per_fuel=max_share_per_fuel, fuel_type=fuel_type, timings=timings,
+        return_components=return_components, pareto_slack=pareto_slack,
+    )
 
-    # ---- Seating filters (חוקים רכים/קשיחים) ----
-    if (profile.passengers or 0) >= 6:
-        # דרישה ל-6+ מושבים: נרכך לסף ≥5 כדי לא לחסום נתונים חסרים,
-        # ואז נוציא "Cars" כדי להסיר סדאנים/קופה (משאיר SUV/Minivan/Van/Wagon).
-        df = df[df["passengers"].fillna(0) >= 5]
-        if "VClass" in df.columns:
-            is_car_class = df["VClass"].astype(str).str.contains("Cars", case=False, na=False)
-            df = df[~is_car_class]
-    else:
-        # דרישה רגילה: לפחות כמספר הנוסעים (קשיח), כדי למנוע רכב קטן מדי.
-        df = df[df["passengers"].fillna(0) >= max(1, int(profile.passengers or 1))]
-        # ל-≤5 נוסעים (ואין עדיפות מרחב) — לא להמליץ על Van/Minivan/Pickup/Truck
-        if not profile.prioritize_space and "VClass" in df.columns:
-            bad_tokens = ["van", "cargo van", "minivan", "pickup", "truck"]
-            mask_bad = df["VClass"].astype(str).str.lower().str.contains("|".join(bad_tokens), na=False)
-            df = df[~mask_bad]
-
-    if df.empty:
-        return df
-
-    # mpg hard filter (optional)
-    if min_mpg is not None and "MPG_comb" in df.columns:
-        df = df[pd.to_numeric(df["MPG_comb"], errors="coerce").fillna(0) >= float(min_mpg)]
 
-    # Optional fuel filter (robust, uses flags built in preprocess_catalog)
-    # Optional fuel filter
-    if fuel_type:
-        ft = (str(fuel_type) or "").strip().lower()
-        s = df["fuelType"].astype(str)
-        if ft and ft != "any":
-            if ft == "bev":
-                df = df[s.str.contains("Electric", case=False, na=False) & ~s.str.contains("Gas", case=False, na=False)]
-            elif ft == "phev":
-                # PHEV יכול להופיע כ-"Regular and Electricity", "Premium and Electricity", וכו'
-                ice_syn = s.str.contains("Gas|Regular|Premium", case=False, na=False)
-                elec = s.str.contains("Electric", case=False, na=False)
-                df = df[ice_syn & elec]
-            elif ft == "gas":
-                df = df[~s.str.contains("Electric", case=False, na=False)]
-
-    df = _dedupe_rows(df)
-    if df.empty:
-        return df
-
-    # Budget hard filter
-    has_price = "price_best" in df.columns and df["price_best"].notna().any()
-    if has_price and profile.budget:
-        df = df[df["price_best"].notna()]
-        df = df[df["price_best"] <= float(profile.budget)]
-
-    weights = _effective_weights(profile, df)
-
-    scored: List[Dict[str, Any]] = []
-    for _, row in df.iterrows():
-        res = score_vehicle_row_v2(row, profile, weights)
-        scored.append(res)
-
-    out = df.copy()
-    out["score"] = [s["score"] for s in scored]
-    out["reasons"] = [s["reasons"] for s in scored]
-
-    keep = [
-        "year",
-        "make", "model", "option_text", "VClass", "fuelType",
-        "passengers", "MPG_comb", "overall_safety", "Range_mi", "electricRange_mi",
-        "price_best", "price_source", "annual_fuel_cost",
-        "score", "reasons",
-    ]
-    existing_keep = [c for c in keep if c in out.columns]
-    out = out[existing_keep].sort_values(["score", "overall_safety", "MPG_comb"], ascending=[False, False, False])
-
-    # Diversify
-    out = _diversify(out, top_n=top_n, max_per_model=max_per_model, max_share_per_fuel=max_share_per_fuel)
-    return out
+def rank_cars_batch(
+    profiles: List[UserProfile],
+    catalog: pd.DataFrame,
+    top_n: int = 20,
+    min_mpg: Optional[float] = None,
+    max_per_model: int = 1,
+    max_share_per_fuel: float = 0.7,
+    fuel_type: Optional[str] = None,
+    chunk_size: int = 256,
+    return_components: bool = False,
+) -> List[pd.DataFrame]:
+    """
+    Ranks many profiles against one catalog; returns one frame per profile, identical
+    to rank_cars(profile, catalog, ...). Preprocessing, the profile-independent filters,
+    dedupe and the diversity codes run once; scores are computed as a
+    (profiles × vehicles) matrix, chunk_size profiles at a time to bound memory.
+    """
+    df = catalog if is_prepared(catalog) else preprocess_catalog(catalog)
+
+    findex = filter_index(df)
+    base_mask = _static_mask(df, min_mpg, fuel_type) & findex.first_occurrence
+    base = df[base_mask]
+    base_pos = np.flatnonzero(base_mask)
+
+    price = _num(base, "price_best")
+    has_price_row = ~np.isnan(price)
+    size = _or_default(_num(base, "vclass_size"), 0.55)
+    shared = {
+        "eff_norm": _efficiency_array(base),
+        "saf_norm": _or_default(_num(base, "safety_norm"), 0.0),
+        "rel_norm": _or_default(_num(base, "reliability_norm"), 0.5),
+    }
+    capacity = _num(base, "passengers")
+    safety, mpg = _num(base, "overall_safety"), _num(base, "MPG_comb")
+    model_codes, fuel_codes = _diversity_codes(base)
+    has_reliability = "reliability_norm" in df.columns
+
+    usage_cache: Dict[str, np.ndarray] = {}
+    results: List[pd.DataFrame] = []
+
+    for start in range(0, len(profiles), max(1, int(chunk_size))):
+        chunk = profiles[start:start + max(1, int(chunk_size))]
+        cand = np.zeros((len(chunk), len(base)), dtype=bool)
+        chunk_weights: List[Dict[str, float]] = []
+        empty_early = [False] * len(chunk)
+
+        for i, profile in enumerate(chunk):
+            seat = _seating_mask(df, profile.passengers, profile.prioritize_space)
+            row_mask = seat[base_pos]
+            # rank_cars מחזיר מוקדם כשאין מועמדים לפני סינון התקציב
+            empty_early[i] = not seat.any() or not row_mask.any()
+            has_price = bool((has_price_row & row_mask).any())
+            if has_price and profile.budget:
+                row_mask = row_mask & findex.price_at_most(profile.budget)[base_pos]
+            cand[i] = row_mask
+            chunk_weights.append(_weights_for(profile, has_price=has_price, has_reliability=has_reliability))
+
+        usages = [(p.usage or "mixed").lower() for p in chunk]
+        for u in set(usages):
+            if u not in usage_cache:
+                usage_cache[u] = _usage_fit_array(size, u)
+        budgets = np.array([_to_float_or_nan(p.budget) for p in chunk])[:, None]
+        required = np.array([p.passengers for p in chunk], dtype=float)[:, None]
+        components = dict(shared)
+        components["p_fit"] = _passenger_fit_array(capacity[None, :], required)
+        components["u_fit"] = np.stack([usage_cache[u] for u in usages]) if chunk else np.empty((0, len(base)))
+        components["b_fit"] = _budget_fit_array(price[None, :], budgets)
+        weight_cols = {
+            wkey: np.array([w.get(wkey, 0.0) for w in chunk_weights])[:, None]
+            for wkey, _ in SCORE_COMPONENTS
+        }
+        scores = _combine_scores(components, weight_cols)
+
+        for i, profile in enumerate(chunk):
+            if empty_early[i]:
+                results.append(df.iloc[0:0])
+                continue
+            idx = np.flatnonzero(cand[i])
+            sc = scores[i, idx]
+            picks = _select_diverse(
+                sc, safety[idx], mpg[idx], model_codes[idx], fuel_codes[idx],
+                top_n, max_per_model, max_share_per_fuel,
+            )
+            results.append(_finalize_ranked(base, idx[picks], scores[i], profile, chunk_weights[i], return_components))
+
+    return results
+
+
+def _streaming_source(path: str) -> str:
+    """The prepared parquet to stream: `path` itself if it is one, else its up-to-date sibling."""
+    if _read_prepared_meta(path).get("version") == PREPARED_VERSION:
+        return path
+    prepared_path = prepared_catalog_path(path)
+    meta = _read_prepared_meta(prepared_path) if os.path.exists(prepared_path) else {}
+    if meta.get("version") == PREPARED_VERSION and meta.get("source_hash") == catalog_content_hash(path):
+        return prepared_path
+    raise ValueError(f"No up-to-date prepared catalog for {path} (run scripts/prepare_catalog.py)")
+
+
+def rank_cars_streaming(
+    profile: UserProfile,
+    path: str,
+    top_n: int = 20,
+    min_mpg: Optional[float] = None,
+    max_per_model: int = 1,
+    max_share_per_fuel: float = 0.7,
+    fuel_type: Optional[str] = None,
+    batch_size: int = 65_536,
+    columns: Optional[List[str]] = None,
+    return_components: bool = False,
+) -> pd.DataFrame:
+    """
+    Out-of-core rank_cars over a prepared parquet: row groups are read batch by batch
+    (pyarrow, memory-mapped), filtered and scored with the same vectorized formula, and
+    only the current diversified top_n survives between batches — rows that fall out of
+    it can never re-enter, so the result equals rank_cars on the fully loaded catalog.
+
+    Peak memory ~ one batch + top_n rows, plus 8 bytes per distinct candidate for the
+    cross-batch dedupe. The normalized columns are catalog-wide statistics, so the file
+    must be the prepared artifact (scripts/prepare_catalog.py), not the raw catalog.
+    """
+    import pyarrow.parquet as pq
+
+    pf = pq.ParquetFile(_streaming_source(path), memory_map=True)
+    names = pf.schema_arrow.names
+    cols = [c for c in dict.fromkeys(columns or SERVING_COLUMNS) if c in names]
+
+    budget_on = bool(profile.budget)
+    has_reliability = "reliability_norm" in cols
+    seen = np.empty(0, dtype=np.uint64)   # hashes של מפתחות dedupe שכבר הופיעו
+    has_price = False                     # כמו has_price ב-rank_cars: מחיר כלשהו בין המועמדים
+    template: Optional[pd.DataFrame] = None
+    kept: Optional[pd.DataFrame] = None   # ה-top_n המגוון עד כה, לפי סדר הקטלוג
+    kept_score = np.empty(0)
+
+    for batch in pf.iter_batches(batch_size=max(1, int(batch_size)), columns=cols):
+        df = batch.to_pandas()
+        df.attrs[PREPARED_ATTR] = PREPARED_VERSION
+
+        mask = _seating_mask(df, profile.passengers, profile.prioritize_space)
+        mask = mask & _static_mask(df, min_mpg, fuel_type)
+        pos = np.flatnonzero(mask)
+        if not len(pos):
+            continue
+
+        # dedupe לפי הופעה ראשונה בכל הקטלוג — גם בין batch-ים
+        keys = vehicle_keys(df.iloc[pos])
+        first = ~pd.Series(keys).duplicated().to_numpy() & ~np.isin(keys, seen)
+        pos, keys = pos[first], keys[first]
+        if not len(pos):
+            continue
+        seen = np.union1d(seen, keys)
+        if template is None:
+            template = df.iloc[0:0]
+
+        findex = filter_index(df)
+        if not has_price and findex.has_price[pos].any():
+            has_price = True
+            if budget_on:
+                # עד עכשיו לא היה מחיר, ולכן כל מה שנשמר נופל בסינון התקציב ומשקלי התקציב משתנים
+                kept, kept_score = None, np.empty(0)
+        if has_price and budget_on:
+            pos = pos[findex.price_at_most(profile.budget)[pos]]
+            if not len(pos):
+                continue
+
+        weights = _weights_for(profile, has_price=has_price, has_reliability=has_reliability)
+        cand = df.iloc[pos]
+        score = _combine_scores(_score_components(cand, profile), weights)
+
+        if kept is not None:
+            cand = pd.concat([kept, cand], ignore_index=True)
+            score = np.concatenate([kept_score, score])
+        model_codes, fuel_codes = _diversity_codes(cand)
+        rows = np.sort(_select_diverse(
+            score, _num(cand, "overall_safety"), _num(cand, "MPG_comb"), model_codes, fuel_codes,
+            top_n, max_per_model, max_share_per_fuel,
+        ))
+        kept, kept_score = cand.iloc[rows].reset_index(drop=True), score[rows]
+
+    if template is None:
+        # אין מועמדים לפני סינון התקציב — כמו rank_cars מחזירים frame ריק עם עמודות הקטלוג
+        return pf.schema_arrow.empty_table().select(cols).to_pandas()
+
+    weights = _weights_for(profile, has_price=has_price, has_reliability=has_reliability)
+    if kept is None:
+        return _finalize_ranked(template, np.empty(0, dtype=np.int64), kept_score, profile, weights, return_components)
+    model_codes, fuel_codes = _diversity_codes(kept)
+    rows = _select_diverse(
+        kept_score, _num(kept, "overall_safety"), _num(kept, "MPG_comb"), model_codes, fuel_codes,
+        top_n, max_per_model, max_share_per_fuel,
+    )
+    return _finalize_ranked(kept, rows, kept_score, profile, weights, return_components)
 
 
 # ---------------- CLI ----------------
@@ -539,16 +1508,18 @@ if __name__ == "__main__":
     parser.add_argument("--annual_km", type=int, default=12000)
     parser.add_argument("--terrain", type=str, default="flat", choices=["flat", "hilly"])
     parser.add_argument("--budget", type=float, default=None)
-    parser.add_argument("--fuel_type", type=str, default="any", choices=["any", "gas", "phev", "bev"])
+    parser.add_argument("--fuel_type", type=str, default="any", choices=["any", "gas", "phev", "bev", "hybrid", "diesel"])
     parser.add_argument("--top", type=int, default=10)
     parser.add_argument("--min_mpg", type=float, default=None)
     parser.add_argument("--max_per_model", type=int, default=1)
     parser.add_argument("--max_share_per_fuel", type=float, default=0.7)
     parser.add_argument("--ownership_years", type=int, default=3)
+    parser.add_argument("--stream", action="store_true", help="Rank batch by batch from the prepared parquet")
     args = parser.parse_args()
 
-    print("\nLoading catalog…", args.catalog)
-    catalog = load_catalog(args.catalog)
+    if not args.stream:
+        print("\nLoading catalog…", args.catalog)
+        catalog = load_catalog(args.catalog, prepared=True)
 
     profile = UserProfile(
         usage=args.usage,
@@ -559,15 +1530,17 @@ if __name__ == "__main__":
         ownership_years=args.ownership_years,
     )
 
-    ranked = rank_cars(
-        profile,
-        catalog,
+    rank_kwargs = dict(
         top_n=args.top,
         min_mpg=args.min_mpg,
         max_per_model=args.max_per_model,
         max_share_per_fuel=args.max_share_per_fuel,
         fuel_type=args.fuel_type,
     )
+    if args.stream:
+        ranked = rank_cars_streaming(profile, args.catalog, **rank_kwargs)
+    else:
+        ranked = rank_cars(profile, catalog, **rank_kwargs)
 
     if ranked.empty:
         print("No vehicles matched your filters. Try relaxing constraints.")
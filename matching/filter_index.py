@@ -0,0 +1,142 @@
+# matching/filter_index.py
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, Tuple
+import weakref
+
+import numpy as np
+import pandas as pd
+
+# ל-≤5 נוסעים (ואין עדיפות מרחב) לא ממליצים על אלה
+UTILITY_CLASS_TOKENS = ["van", "cargo van", "minivan", "pickup", "truck"]
+
+# מפתח הכפילויות של המנוע. כל סינון קשיח קורא רק עמודות מתוכו, ולכן dedupe על
+# הקטלוג כולו (הופעה ראשונה) שקול ל-dedupe אחרי הסינון
+DEDUPE_KEYS = ["make", "model", "option_text", "VClass", "fuelType", "MPG_comb", "overall_safety", "passengers"]
+
+
+def _frozen(mask: np.ndarray) -> np.ndarray:
+    # ה-bitmaps משותפים לכל הבקשות — אסור שמישהו יעשה עליהם &= בטעות
+    mask = np.ascontiguousarray(mask, dtype=bool)
+    mask.flags.writeable = False
+    return mask
+
+
+@dataclass
+class FilterIndex:
+    """
+    Row-aligned boolean bitmaps for the hard filters of one catalog frame.
+    Built once per frame; a request's hard-filter step is then a few ANDs.
+    """
+    n_rows: int
+    seats: np.ndarray                  # passengers (NaN -> 0)
+    car_class: np.ndarray              # VClass contains "Cars"
+    utility_class: np.ndarray          # van / minivan / pickup / truck
+    fuel: Dict[str, np.ndarray]        # "bev" / "phev" / "gas" (+ "hybrid" / "diesel" לפי powertrain)
+    has_price: np.ndarray              # price_best notna
+    price_order: np.ndarray            # positions of priced rows, ascending by price_best
+    price_sorted: np.ndarray           # price_best[price_order]
+    mpg_order: np.ndarray              # all positions, ascending by MPG_comb (NaN -> 0)
+    mpg_sorted: np.ndarray
+    first_occurrence: np.ndarray       # first row of each DEDUPE_KEYS group (vehicle_key when present)
+    _seat_masks: Dict[int, np.ndarray] = field(default_factory=dict, repr=False)
+
+    def seats_at_least(self, k: int) -> np.ndarray:
+        mask = self._seat_masks.get(k)
+        if mask is None:
+            mask = self._seat_masks[k] = _frozen(self.seats >= k)
+        return mask
+
+    def _mask_of(self, positions: np.ndarray) -> np.ndarray:
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[positions] = True
+        return mask
+
+    def price_positions_at_most(self, budget: float) -> np.ndarray:
+        """Positions with price_best <= budget (rows without a price never match)."""
+        budget = float(budget)
+        if np.isnan(budget):
+            return self.price_order[:0]
+        return self.price_order[: np.searchsorted(self.price_sorted, budget, side="right")]
+
+    def price_at_most(self, budget: float) -> np.ndarray:
+        return self._mask_of(self.price_positions_at_most(budget))
+
+    def mpg_at_least(self, min_mpg: float) -> np.ndarray:
+        """MPG_comb (missing counts as 0) >= min_mpg."""
+        start = np.searchsorted(self.mpg_sorted, float(min_mpg), side="left")
+        return self._mask_of(self.mpg_order[start:])
+
+
+def build_filter_index(df: pd.DataFrame) -> FilterIndex:
+    n = len(df)
+    seats = pd.to_numeric(df["passengers"], errors="coerce").fillna(0).to_numpy(dtype=float)
+
+    if "VClass" in df.columns:
+        vclass = df["VClass"].astype(str)
+        car_class = vclass.str.contains("Cars", case=False, na=False)
+        utility_class = vclass.str.lower().str.contains("|".join(UTILITY_CLASS_TOKENS), na=False)
+    else:
+        car_class = utility_class = np.zeros(n, dtype=bool)
+
+    s = df["fuelType"].astype(str)
+    elec = s.str.contains("Electric", case=False, na=False)
+    gas_kw = s.str.contains("Gas", case=False, na=False)
+    # PHEV יכול להופיע כ-"Regular and Electricity", "Premium and Electricity", וכו'
+    ice_syn = s.str.contains("Gas|Regular|Premium", case=False, na=False)
+    fuel = {
+        "bev": _frozen(elec & ~gas_kw),
+        "phev": _frozen(ice_syn & elec),
+        "gas": _frozen(~elec),
+    }
+    # hybrid / diesel — מעמודת ה-powertrain שמחושבת ב-preprocess_catalog
+    if "powertrain" in df.columns:
+        powertrain = df["powertrain"].astype(str).to_numpy()
+        fuel["hybrid"] = _frozen(powertrain == "HEV")
+        fuel["diesel"] = _frozen(powertrain == "diesel")
+
+    # אינדקסים ממוינים לסינוני טווח (תקציב / min_mpg) — searchsorted במקום סריקת עמודה
+    price = pd.to_numeric(df["price_best"], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    has_price = ~np.isnan(price)
+    priced = np.flatnonzero(has_price)
+    price_order = priced[np.argsort(price[priced], kind="stable")]
+    mpg = pd.to_numeric(df["MPG_comb"], errors="coerce").fillna(0).to_numpy(dtype=float)
+    mpg_order = np.argsort(mpg, kind="stable")
+
+    if "vehicle_key" in df.columns:
+        # hash של DEDUPE_KEYS שחושב ב-preprocess_catalog — unique על uint64 במקום על 8 עמודות
+        first_occurrence = ~pd.Series(df["vehicle_key"].to_numpy()).duplicated().to_numpy()
+    else:
+        keys = [c for c in DEDUPE_KEYS if c in df.columns]
+        first_occurrence = ~df.duplicated(subset=keys).to_numpy() if keys else np.ones(n, dtype=bool)
+
+    return FilterIndex(
+        n_rows=n,
+        seats=seats,
+        car_class=_frozen(car_class),
+        utility_class=_frozen(utility_class),
+        fuel=fuel,
+        has_price=_frozen(has_price),
+        price_order=price_order,
+        price_sorted=price[price_order],
+        mpg_order=mpg_order,
+        mpg_sorted=mpg[mpg_order],
+        first_occurrence=_frozen(first_occurrence),
+    )
+
+
+# cache לפי אובייקט ה-frame (לא לפי תוכן): קטלוג מוכן משרת בקשות רבות ולא משתנה במקום
+_INDEX_CACHE: Dict[int, Tuple[weakref.ref, FilterIndex]] = {}
+
+
+def filter_index(df: pd.DataFrame) -> FilterIndex:
+    """Returns the cached FilterIndex for this frame object, building it on first use."""
+    key = id(df)
+    hit = _INDEX_CACHE.get(key)
+    if hit is not None and hit[0]() is df and hit[1].n_rows == len(df):
+        return hit[1]
+    idx = build_filter_index(df)
+    _INDEX_CACHE[key] = (weakref.ref(df), idx)
+    weakref.finalize(df, _INDEX_CACHE.pop, key, None)
+    return idx
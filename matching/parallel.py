@@ -0,0 +1,227 @@
+# matching/parallel.py
+"""
+Sharded scoring for listing-scale catalogs — rank_cars(..., workers=N).
+
+The scoring inputs of a prepared frame are laid out once, column-major, as a float64
+matrix in shared memory. Worker processes attach to it by name, score their shard of
+the candidate positions and send back only the shard's diversified top_n (positions +
+scores); the parent merges those and runs the final _select_diverse. The diversity rule
+is a greedy per-model cap, so a row outside its shard's top_n can never make the global
+top_n — the result equals the single-process rank_cars.
+"""
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from matching.engine import (
+    SCORING_INPUTS,
+    RankingSession,
+    UserProfile,
+    _candidate_positions,
+    _combine_scores,
+    _components_from_inputs,
+    _diversity_codes,
+    _finalize_ranked,
+    _pareto_prune,
+    _num,
+    _scoring_inputs,
+    _select_diverse,
+    _weights_for,
+    _with_timings,
+)
+from matching.filter_index import filter_index
+from matching.timing import recorder
+
+# מתחת לזה תקורת התהליכים גדולה מהחיסכון — מדרגים בתהליך אחד
+MIN_SHARD_ROWS = 50_000
+
+MATRIX_COLUMNS = SCORING_INPUTS + ["overall_safety", "MPG_comb", "model_code", "fuel_code"]
+
+
+# ---------------- Shared scoring matrix (parent) ----------------
+class _SharedMatrix:
+    def __init__(self, df: pd.DataFrame):
+        inputs = _scoring_inputs(df)
+        model_codes, fuel_codes = _diversity_codes(df)
+        extra = {
+            "overall_safety": _num(df, "overall_safety"),
+            "MPG_comb": _num(df, "MPG_comb"),
+            "model_code": model_codes,  # קודים שלמים < 2**53 — מדויקים ב-float64
+            "fuel_code": fuel_codes,
+        }
+        self.shape = (len(MATRIX_COLUMNS), len(df))
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, 8 * self.shape[0] * self.shape[1]))
+        self.data = np.ndarray(self.shape, dtype=np.float64, buffer=self.shm.buf)
+        for i, col in enumerate(MATRIX_COLUMNS):
+            self.data[i] = inputs[col] if col in inputs else extra[col]
+        self._finalizer = weakref.finalize(self, _release, self.shm)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+
+def _release(shm: shared_memory.SharedMemory) -> None:
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+    try:
+        shm.close()
+    except BufferError:
+        pass  # עדיין יש view חי על הבלוק; המיפוי ישוחרר איתו
+
+
+# cache לפי אובייקט ה-frame, כמו filter_index: בונים את המטריצה פעם אחת לקטלוג
+_MATRIX_CACHE: Dict[int, Tuple[weakref.ref, _SharedMatrix]] = {}
+_MATRIX_LOCK = threading.Lock()
+
+
+def shared_scoring_matrix(df: pd.DataFrame) -> _SharedMatrix:
+    key = id(df)
+    with _MATRIX_LOCK:
+        hit = _MATRIX_CACHE.get(key)
+        if hit is not None and hit[0]() is df and hit[1].shape[1] == len(df):
+            return hit[1]
+        matrix = _SharedMatrix(df)
+        _MATRIX_CACHE[key] = (weakref.ref(df), matrix)
+        weakref.finalize(df, _MATRIX_CACHE.pop, key, None)
+        return matrix
+
+
+# ---------------- Worker side ----------------
+_ATTACHED: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    shm = _ATTACHED.get(name)
+    if shm is None:
+        # קטלוג אחד חי בכל רגע: מטריצה חדשה (hot reload) = סוגרים את המיפויים הישנים,
+        # אחרת כל worker מחזיק מטריצה מלאה לכל reload שההורה כבר עשה לה unlink
+        for old in list(_ATTACHED):
+            stale = _ATTACHED.pop(old)
+            try:
+                stale.close()
+            except BufferError:
+                pass  # עדיין יש view חי על הבלוק; המיפוי ישוחרר איתו
+        # ה-workers חולקים את ה-resource tracker של ההורה, ורק ההורה עושה unlink
+        shm = _ATTACHED[name] = shared_memory.SharedMemory(name=name)
+    return shm
+
+
+def _columns(data: np.ndarray, positions: np.ndarray) -> Dict[str, np.ndarray]:
+    x = {col: data[i, positions] for i, col in enumerate(MATRIX_COLUMNS)}
+    x["has_elec"] = x["has_elec"].astype(bool)
+    x["has_gas"] = x["has_gas"].astype(bool)
+    x["model_code"] = x["model_code"].astype(np.int64)
+    x["fuel_code"] = x["fuel_code"].astype(np.int64)
+    return x
+
+
+def _score_shard(
+    name: str,
+    shape: Tuple[int, int],
+    positions: np.ndarray,
+    profile: UserProfile,
+    weights: Dict[str, float],
+    top_n: int,
+    max_per_model: int,
+    max_share_per_fuel: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Scores one shard; returns its diversified top_n as (positions, scores) in catalog order."""
+    data = np.ndarray(shape, dtype=np.float64, buffer=_attach(name).buf)
+    x = _columns(data, positions)
+    score = _combine_scores(_components_from_inputs(x, profile), weights)
+    rows = np.sort(_select_diverse(
+        score, x["overall_safety"], x["MPG_comb"], x["model_code"], x["fuel_code"],
+        top_n, max_per_model, max_share_per_fuel,
+    ))
+    return positions[rows], score[rows]
+
+
+# ---------------- Pool ----------------
+_POOLS: Dict[int, ProcessPoolExecutor] = {}
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    """Process pool per worker count, created on first use and reused across requests."""
+    with _POOL_LOCK:
+        pool = _POOLS.get(workers)
+        if pool is None:
+            pool = _POOLS[workers] = ProcessPoolExecutor(max_workers=workers)
+        return pool
+
+
+def shutdown_pools() -> None:
+    with _POOL_LOCK:
+        for pool in _POOLS.values():
+            pool.shutdown(cancel_futures=True)
+        _POOLS.clear()
+
+
+# ---------------- Public entry ----------------
+def rank_cars_sharded(
+    profile: UserProfile,
+    df: pd.DataFrame,
+    workers: int,
+    top_n: int = 20,
+    min_mpg: Optional[float] = None,
+    max_per_model: int = 1,
+    max_share_per_fuel: float = 0.7,
+    fuel_type: Optional[str] = None,
+    min_shard_rows: int = MIN_SHARD_ROWS,
+    timings: bool = False,
+    return_components: bool = False,
+    pareto_slack: Optional[int] = None,
+) -> pd.DataFrame:
+    """rank_cars on a prepared frame with scoring spread over `workers` processes."""
+    rec = recorder(timings)
+    pos = _candidate_positions(df, profile, min_mpg, fuel_type, rec)
+    if pareto_slack is not None:
+        pos = _pareto_prune(df, pos, profile, max(0, int(max_per_model) - 1 + int(pareto_slack)), rec)
+    findex = filter_index(df)
+    has_price = bool(findex.has_price[pos].any())
+    if has_price and profile.budget:
+        pos = pos[findex.price_at_most(profile.budget)[pos]]
+    rec.mark("budget", pos)
+
+    n_shards = min(int(workers), len(pos) // max(1, int(min_shard_rows)))
+    if n_shards < 2:
+        return RankingSession(reuse=False).rank(
+            profile, df, top_n=top_n, min_mpg=min_mpg, max_per_model=max_per_model,
+            max_share_per_fuel=max_share_per_fuel, fuel_type=fuel_type, timings=timings,
+            return_components=return_components, pareto_slack=pareto_slack,
+        )
+
+    weights = _weights_for(profile, has_price=has_price, has_reliability="reliability_norm" in df.columns)
+    matrix = shared_scoring_matrix(df)
+    pool = get_pool(int(workers))
+    futures = [
+        pool.submit(
+            _score_shard, matrix.name, matrix.shape, shard, profile, weights,
+            top_n, max_per_model, max_share_per_fuel,
+        )
+        for shard in np.array_split(pos, n_shards)
+    ]
+    parts: List[Tuple[np.ndarray, np.ndarray]] = [f.result() for f in futures]
+    rec.mark("shards", sum(len(p) for p, _ in parts))  # ניקוד + top_n מקומי בכל worker
+
+    # ה-shards רציפים ובסדר הקטלוג, כך ששבירת שוויון (יציבה לפי מיקום) נשמרת
+    merged = np.concatenate([p for p, _ in parts])
+    score = np.concatenate([s for _, s in parts])
+    x = _columns(matrix.data, merged)
+    rows = _select_diverse(
+        score, x["overall_safety"], x["MPG_comb"], x["model_code"], x["fuel_code"],
+        top_n, max_per_model, max_share_per_fuel, rec,
+    )
+    out = _finalize_ranked(df.iloc[merged], rows, score, profile, weights, return_components)
+    rec.mark("finalize", len(out))
+    return _with_timings(out, rec, timings)
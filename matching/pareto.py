@@ -0,0 +1,110 @@
+# matching/pareto.py
+# רכבים נשלטים (dominated) בתוך אותה קבוצה — לעולם לא נבחרים, אז לא צריך לנקד אותם
+from __future__ import annotations
+
+from typing import Dict, Tuple
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from matching.engine import _efficiency_array, _num, _or_default
+from matching.filter_index import filter_index
+
+# כל מה שקובע את הסינונים הקשיחים, את p_fit / u_fit ואת קוד הגיוון — זהה בתוך קבוצה
+GROUP_KEYS = ["make", "model", "VClass", "passengers", "fuelType", "powertrain"]
+PAIR_CHUNK = 1_000_000
+
+
+def _dominance_dims(df: pd.DataFrame) -> np.ndarray:
+    """
+    (rows × dims), higher is better on every dim: the profile-independent score components,
+    then the raw tie-break columns of _rank_order (NaN last). MPG_comb also covers min_mpg.
+    """
+    def _nan_last(x: np.ndarray) -> np.ndarray:
+        return np.where(np.isnan(x), -np.inf, x)
+
+    return np.column_stack([
+        _efficiency_array(df),
+        _or_default(_num(df, "safety_norm"), 0.0),
+        _or_default(_num(df, "reliability_norm"), 0.5),
+        _nan_last(_num(df, "overall_safety")),
+        _nan_last(_num(df, "MPG_comb")),
+    ])
+
+
+def _group_pairs(starts: np.ndarray, sizes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """All ordered (a, b), a != b, within each group [start, start + size) of a sorted row order."""
+    rows_start = np.repeat(starts, sizes)
+    rows = rows_start + (np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes))
+    reps = np.repeat(sizes, sizes)                    # כל שורה מול כל חברי הקבוצה שלה
+    a = np.repeat(rows, reps)
+    b = np.repeat(rows_start, reps) + (np.arange(reps.sum()) - np.repeat(np.cumsum(reps) - reps, reps))
+    keep = a != b
+    return a[keep], b[keep]
+
+
+def build_dominance_counts(df: pd.DataFrame) -> np.ndarray:
+    """
+    For each canonical (first-occurrence) row: how many canonical rows of its GROUP_KEYS group
+    dominate it — at least as good on every _dominance_dims column and ahead of it in
+    _rank_order's tie-break (better overall_safety or MPG_comb, or earlier in the catalog).
+
+    Such a row scores >= the dominated one for any non-negative weights and sorts before it
+    on ties, and shares its model, filters and diversity code. A row dominated by
+    max_per_model others is therefore never picked while the price term is off (the budget
+    fit rises with price up to the budget, so price cannot be a profile-independent dim).
+    Duplicate (non-canonical) rows get -1; dedupe drops them before scoring anyway.
+    """
+    counts = np.full(len(df), -1, dtype=np.int64)
+    canon = np.flatnonzero(filter_index(df).first_occurrence)
+    if not len(canon):
+        return counts
+    sub = df.iloc[canon]
+    keys = [c for c in GROUP_KEYS if c in sub.columns]
+    gid = sub.groupby(keys, sort=False, observed=True, dropna=False).ngroup().to_numpy()
+
+    order = np.argsort(gid, kind="stable")             # בתוך קבוצה: סדר הקטלוג
+    sizes_all = np.bincount(gid)
+    starts_all = np.concatenate([[0], np.cumsum(sizes_all)[:-1]])
+    multi = np.flatnonzero(sizes_all > 1)              # קבוצה של שורה אחת — אין את מי להשוות
+    x = _dominance_dims(sub)[order]
+    tie_cols = x[:, -2:]
+
+    local = np.zeros(len(sub), dtype=np.int64)
+    pair_cost = np.cumsum(sizes_all[multi].astype(np.int64) ** 2)
+    lo = 0
+    while lo < len(multi):
+        hi = max(lo + 1, int(np.searchsorted(pair_cost, pair_cost[lo] - sizes_all[multi[lo]] ** 2 + PAIR_CHUNK, side="right")))
+        groups = multi[lo:hi]
+        a, b = _group_pairs(starts_all[groups], sizes_all[groups])
+        # a < b בתוך הקבוצה = a מוקדם יותר בקטלוג (order יציב)
+        dominates = (x[a] >= x[b]).all(axis=1) & ((tie_cols[a] > tie_cols[b]).any(axis=1) | (a < b))
+        local += np.bincount(b[dominates], minlength=len(sub))
+        lo = hi
+
+    counts[canon[order]] = local
+    return counts
+
+
+# cache לפי אובייקט ה-frame, כמו filter_index
+_COUNTS_CACHE: Dict[int, Tuple[weakref.ref, np.ndarray]] = {}
+
+
+def dominance_counts(df: pd.DataFrame) -> np.ndarray:
+    """Cached build_dominance_counts for this (prepared) frame object."""
+    key = id(df)
+    hit = _COUNTS_CACHE.get(key)
+    if hit is not None and hit[0]() is df and len(hit[1]) == len(df):
+        return hit[1]
+    counts = build_dominance_counts(df)
+    counts.flags.writeable = False
+    _COUNTS_CACHE[key] = (weakref.ref(df), counts)
+    weakref.finalize(df, _COUNTS_CACHE.pop, key, None)
+    return counts
+
+
+def pareto_frontier(df: pd.DataFrame, depth: int = 0) -> np.ndarray:
+    """Row mask: canonical rows dominated by at most `depth` rows of their group (0 = the frontier)."""
+    counts = dominance_counts(df)
+    return (counts >= 0) & (counts <= depth)
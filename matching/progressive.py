@@ -0,0 +1,108 @@
+# matching/progressive.py
+# דירוג "anytime": תשובה זמנית מתוך מקטע קטן של הקטלוג, ואז התשובה המלאה
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator, Optional, Tuple
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from matching.engine import (
+    POWERTRAINS,
+    RankingSession,
+    UserProfile,
+    _efficiency_array,
+    _num,
+    _or_default,
+    is_prepared,
+    preprocess_catalog,
+    rank_cars,
+)
+from matching.filter_index import filter_index
+
+PROVISIONAL = "provisional"
+FINAL = "final"
+SEGMENT_PER_STRATUM = 16
+# מקטע שהוא יותר מרבע מהקטלוג לא חוסך מספיק — מדלגים ישר לתשובה המלאה
+SEGMENT_MAX_SHARE = 0.25
+PRICE_BANDS = 8
+
+
+def _strata(df: pd.DataFrame) -> np.ndarray:
+    """
+    powertrain × seat bucket × price band (+ "no price") — one code per row. Every hard
+    filter (fuel_type, passengers, budget) keeps whole strata, so the segment still has
+    candidates for any profile.
+    """
+    if "powertrain" in df.columns:
+        powertrain = pd.Categorical(df["powertrain"], categories=POWERTRAINS).codes.astype(np.int64) + 1
+    else:
+        powertrain = np.zeros(len(df), dtype=np.int64)
+    seats = np.nan_to_num(_num(df, "passengers"), nan=5.0)
+    seat_bucket = np.digitize(seats, [5, 6, 8])             # ≤4 / 5 / 6-7 / 8+
+    price = _num(df, "price_best")
+    band = np.full(len(df), PRICE_BANDS, dtype=np.int64)      # PRICE_BANDS = אין מחיר
+    priced = ~np.isnan(price)
+    if priced.any():
+        edges = np.quantile(price[priced], np.linspace(0, 1, PRICE_BANDS + 1)[1:-1])
+        band[priced] = np.searchsorted(edges, price[priced], side="right")
+    return (powertrain * 4 + seat_bucket) * (PRICE_BANDS + 1) + band
+
+
+def build_provisional_segment(df: pd.DataFrame, per_stratum: int = SEGMENT_PER_STRATUM) -> np.ndarray:
+    """
+    Catalog positions (ascending) of the top `per_stratum` canonical rows of each stratum by
+    the profile-independent part of the score (efficiency + safety + reliability).
+    """
+    canon = np.flatnonzero(filter_index(df).first_occurrence)
+    prior = (
+        _efficiency_array(df)
+        + _or_default(_num(df, "safety_norm"), 0.0)
+        + _or_default(_num(df, "reliability_norm"), 0.5)
+    )[canon]
+    strata = _strata(df)[canon]
+    order = np.lexsort((canon, -prior, strata))              # בתוך stratum: prior יורד, ואז סדר הקטלוג
+    sorted_strata = strata[order]
+    starts = np.flatnonzero(np.r_[True, sorted_strata[1:] != sorted_strata[:-1]])
+    rank_in_stratum = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    return np.sort(canon[order[rank_in_stratum < per_stratum]])
+
+
+# cache לפי אובייקט ה-frame, כמו filter_index; ה-frame של המקטע עצמו נשמר כדי שגם ה-filter_index שלו יישאר חם
+_SEGMENT_CACHE: Dict[int, Tuple[weakref.ref, int, int, Optional[pd.DataFrame]]] = {}
+
+
+def provisional_segment(df: pd.DataFrame, per_stratum: int = SEGMENT_PER_STRATUM) -> Optional[pd.DataFrame]:
+    """The cached segment frame for this prepared catalog, or None if it would not be much smaller."""
+    key = id(df)
+    hit = _SEGMENT_CACHE.get(key)
+    if hit is not None and hit[0]() is df and hit[1] == len(df) and hit[2] == per_stratum:
+        return hit[3]
+    positions = build_provisional_segment(df, per_stratum)
+    segment = df.iloc[positions] if len(positions) <= SEGMENT_MAX_SHARE * len(df) else None
+    _SEGMENT_CACHE[key] = (weakref.ref(df), len(df), per_stratum, segment)
+    weakref.finalize(df, _SEGMENT_CACHE.pop, key, None)
+    return segment
+
+
+def rank_cars_progressive(
+    profile: UserProfile,
+    catalog: pd.DataFrame,
+    session: Optional[RankingSession] = None,
+    per_stratum: int = SEGMENT_PER_STRATUM,
+    **kwargs: Any,
+) -> Iterator[Tuple[str, pd.DataFrame]]:
+    """
+    Yields (PROVISIONAL, ranked) from the provisional segment, then (FINAL, ranked) equal to
+    rank_cars(profile, catalog, **kwargs). Provisional scores are exact — it is a full ranking
+    of fewer rows — so a provisional pick that survives keeps its score. The provisional step
+    is skipped on small catalogs, where the segment would be most of the catalog.
+    An unprepared catalog is prepared first; the normalizations need every row.
+    """
+    df = catalog if is_prepared(catalog) else preprocess_catalog(catalog)
+    segment = provisional_segment(df, per_stratum)
+    if segment is not None:
+        yield PROVISIONAL, rank_cars(profile, segment, **kwargs)
+    rank = session.rank if session is not None else rank_cars
+    yield FINAL, rank(profile, df, **kwargs)
@@ -0,0 +1,179 @@
+# matching/similarity.py
+# "More like this": שכנים קרובים במרחב הפיצ'רים המנורמלים של הקטלוג המוכן
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from matching.engine import (
+    POWERTRAINS,
+    RESULT_COLUMNS,
+    _seating_mask,
+    is_prepared,
+    preprocess_catalog,
+    vehicle_keys,
+)
+from matching.filter_index import filter_index
+
+# (column, fill for missing) — כולם כבר בסקאלה 0..1 אחרי preprocess_catalog
+NORMALIZED_FEATURES = [
+    ("vclass_size", 0.55),
+    ("mpg_norm", 0.5),
+    ("safety_norm", 0.5),
+    ("reliability_norm", 0.5),
+]
+# powertrain שונה = מרחק sqrt(2) * POWERTRAIN_WEIGHT; EV לא "דומה" לרכב בנזין רק כי הם באותו גודל
+POWERTRAIN_WEIGHT = 0.5
+SIMILAR_COLUMNS = [c for c in RESULT_COLUMNS if c not in ("score", "reasons")] + ["vehicle_key", "distance"]
+FILTER_KEYS = {"fuel_type", "budget", "passengers", "prioritize_space", "min_mpg"}
+
+
+@dataclass
+class SimilarityIndex:
+    """
+    Feature matrix over the canonical (first-occurrence) rows of one prepared catalog.
+    Queries are a brute-force (n × d) matrix-vector product — d is ~10, so a full scan is
+    ~0.2 ms at 10k rows and ~15 ms at 1M with numpy alone; no tree structure needed.
+    """
+    n_rows: int                        # len(df) — positions refer to the catalog frame
+    positions: np.ndarray              # catalog position of each indexed row
+    keys: np.ndarray                   # vehicle_keys of the indexed rows
+    features: np.ndarray               # float32 (n, d)
+    sq_norms: np.ndarray               # |features|² per row
+    model_codes: np.ndarray            # (make, model) group — to skip other trims of the same car
+    _key_order: np.ndarray             # argsort(keys) for key lookup
+
+    def row_of(self, vehicle_key: int) -> int:
+        key = np.uint64(vehicle_key)
+        i = np.searchsorted(self.keys, key, sorter=self._key_order)
+        if i >= len(self.keys) or self.keys[self._key_order[i]] != key:
+            raise KeyError(f"Unknown vehicle_key {vehicle_key}")
+        return int(self._key_order[i])
+
+    def query(self, row: int, k: int, allowed: Optional[np.ndarray] = None, exclude_same_model: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """Up to k nearest indexed rows to `row` (excluding itself): (rows, distances), nearest first."""
+        q = self.features[row]
+        d2 = self.features @ q                     # |x - q|² = |x|² - 2x·q + |q|², במקום
+        d2 *= -2.0
+        d2 += self.sq_norms
+        d2 += q @ q
+        np.maximum(d2, 0.0, out=d2)
+        if exclude_same_model:
+            d2[self.model_codes == self.model_codes[row]] = np.inf
+        d2[row] = np.inf
+        if allowed is not None:
+            d2[~allowed] = np.inf
+
+        k = min(max(0, int(k)), int(np.isfinite(d2).sum()))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        near = np.argpartition(d2, k - 1)[:k]
+        near = near[np.lexsort((near, d2[near]))]   # יציב: מרחק ואז מיקום בקטלוג
+        return near, np.sqrt(d2[near])
+
+
+def build_similarity_index(df: pd.DataFrame) -> SimilarityIndex:
+    positions = np.flatnonzero(filter_index(df).first_occurrence)
+    sub = df.iloc[positions]
+
+    cols = []
+    for col, fill in NORMALIZED_FEATURES:
+        x = pd.to_numeric(sub[col], errors="coerce") if col in sub.columns else pd.Series(np.nan, index=sub.index)
+        cols.append(x.fillna(fill).to_numpy(dtype=float))
+
+    seats = pd.to_numeric(sub["passengers"], errors="coerce").fillna(5).to_numpy(dtype=float)
+    cols.append((np.clip(seats, 2, 9) - 2) / 7)
+
+    # מחיר בסקאלה לוגריתמית, 0..1 על טווח הקטלוג; חסר → חציון
+    price = pd.to_numeric(sub["price_best"], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    log_price = np.log(np.where(price > 0, price, np.nan))
+    if np.isfinite(log_price).any():
+        lo, hi = np.nanmin(log_price), np.nanmax(log_price)
+        scaled = (log_price - lo) / max(hi - lo, 1e-9)
+        cols.append(np.where(np.isnan(scaled), np.nanmedian(scaled), scaled))
+    else:
+        cols.append(np.full(len(sub), 0.5))
+
+    powertrain = sub["powertrain"].astype(str).to_numpy() if "powertrain" in sub.columns else np.full(len(sub), "ICE")
+    cols.extend(POWERTRAIN_WEIGHT * (powertrain == p) for p in POWERTRAINS)
+
+    features = np.column_stack(cols).astype(np.float32)
+    keys = vehicle_keys(sub)
+    model_codes = sub.groupby(["make", "model"], sort=False, observed=True, dropna=False).ngroup().to_numpy()
+    return SimilarityIndex(
+        n_rows=len(df),
+        positions=positions,
+        keys=keys,
+        features=features,
+        sq_norms=np.einsum("ij,ij->i", features, features),
+        model_codes=model_codes,
+        _key_order=np.argsort(keys, kind="stable"),
+    )
+
+
+# cache לפי אובייקט ה-frame, כמו filter_index
+_INDEX_CACHE: Dict[int, Tuple[weakref.ref, SimilarityIndex]] = {}
+
+
+def similarity_index(df: pd.DataFrame) -> SimilarityIndex:
+    """Returns the cached SimilarityIndex for this (prepared) frame object, building it on first use."""
+    key = id(df)
+    hit = _INDEX_CACHE.get(key)
+    if hit is not None and hit[0]() is df and hit[1].n_rows == len(df):
+        return hit[1]
+    idx = build_similarity_index(df)
+    _INDEX_CACHE[key] = (weakref.ref(df), idx)
+    weakref.finalize(df, _INDEX_CACHE.pop, key, None)
+    return idx
+
+
+def _filter_mask(df: pd.DataFrame, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+    """Catalog-row mask for the optional filters (same bitmaps as rank_cars' hard filters)."""
+    filters = {k: v for k, v in (filters or {}).items() if v is not None}
+    unknown = set(filters) - FILTER_KEYS
+    if unknown:
+        raise ValueError(f"Unknown similarity filters: {sorted(unknown)}")
+    if not filters:
+        return None
+
+    findex = filter_index(df)
+    mask = np.ones(len(df), dtype=bool)
+    fuel = str(filters.get("fuel_type", "any")).lower()
+    if fuel != "any" and fuel in findex.fuel:
+        mask = mask & findex.fuel[fuel]
+    if "budget" in filters:
+        mask = mask & findex.price_at_most(filters["budget"])
+    if "passengers" in filters:
+        # אותם חוקי מושבים כמו בדירוג (6+ → לא סדאן; ≤5 → בלי ואן/טנדר)
+        mask = mask & _seating_mask(df, int(filters["passengers"]), bool(filters.get("prioritize_space")))
+    if "min_mpg" in filters:
+        mask = mask & findex.mpg_at_least(filters["min_mpg"])
+    return mask
+
+
+def similar_to(
+    catalog: pd.DataFrame,
+    vehicle_key: int,
+    k: int = 5,
+    filters: Optional[Dict[str, Any]] = None,
+    exclude_same_model: bool = True,
+) -> pd.DataFrame:
+    """
+    The k vehicles nearest to `vehicle_key` (see engine.vehicle_keys), nearest first.
+    filters: fuel_type ("bev"/"phev"/"hybrid"/"diesel"/"gas"/"any"), budget, min_mpg, and
+    passengers (+ prioritize_space) with rank_cars' seating rules.
+    Other trims of the same make+model are skipped unless exclude_same_model=False.
+    """
+    df = catalog if is_prepared(catalog) else preprocess_catalog(catalog)
+    idx = similarity_index(df)
+    mask = _filter_mask(df, filters)
+    allowed = mask[idx.positions] if mask is not None else None
+    rows, dist = idx.query(idx.row_of(vehicle_key), k, allowed, exclude_same_model)
+
+    cols = [c for c in SIMILAR_COLUMNS if c in df.columns]
+    out = df.iloc[idx.positions[rows]][cols].reset_index(drop=True)
+    return out.assign(vehicle_key=idx.keys[rows], distance=dist)
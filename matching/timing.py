@@ -0,0 +1,106 @@
+# matching/timing.py
+"""
+Per-stage wall time + candidate counts for rank_cars.
+
+    with stage_timing(sink):          # sink(RankTimings) after every rank in this context
+        rank_cars(profile, catalog)
+
+    ranked = rank_cars(profile, catalog, timings=True)
+    ranked.attrs["stage_timings"]     # {"total_ms": ..., "stages": [{"stage", "ms", "candidates"}, ...]}
+
+Disabled (no hook, timings=False) the engine talks to a no-op recorder: one ContextVar
+lookup per call and an empty method call per stage.
+"""
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import time
+
+import numpy as np
+
+TIMINGS_ATTR = "stage_timings"
+
+
+@dataclass
+class StageTiming:
+    stage: str
+    seconds: float
+    candidates: Optional[int] = None
+
+
+@dataclass
+class RankTimings:
+    stages: List[StageTiming] = field(default_factory=list)
+    total_seconds: float = 0.0
+    cached: bool = False  # התשובה הגיעה מ-cache התוצאות ולא הורץ דירוג
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "total_ms": round(self.total_seconds * 1e3, 3),
+            "cached": self.cached,
+            "stages": [
+                {"stage": s.stage, "ms": round(s.seconds * 1e3, 3), "candidates": s.candidates}
+                for s in self.stages
+            ],
+        }
+
+
+_HOOK: ContextVar[Optional[Callable[[RankTimings], None]]] = ContextVar("carmatch_stage_hook", default=None)
+
+
+@contextmanager
+def stage_timing(callback: Optional[Callable[[RankTimings], None]]) -> Iterator[None]:
+    """Sends the RankTimings of every rank_cars call made inside the block to callback."""
+    token = _HOOK.set(callback)
+    try:
+        yield
+    finally:
+        _HOOK.reset(token)
+
+
+class _Recorder:
+    def __init__(self) -> None:
+        self.timings = RankTimings()
+        self._start = self._last = time.perf_counter()
+
+    def __bool__(self) -> bool:
+        return True
+
+    def mark(self, stage: str, candidates: Any = None) -> None:
+        """Closes `stage` (time since the previous mark). candidates: count, mask or positions."""
+        now = time.perf_counter()
+        if isinstance(candidates, np.ndarray):
+            candidates = int(np.count_nonzero(candidates)) if candidates.dtype == bool else len(candidates)
+        self.timings.stages.append(StageTiming(stage, now - self._last, candidates))
+        self._last = now
+
+    def finish(self) -> RankTimings:
+        self.timings.total_seconds = time.perf_counter() - self._start
+        hook = _HOOK.get()
+        if hook is not None:
+            hook(self.timings)
+        return self.timings
+
+
+class _NullRecorder:
+    def __bool__(self) -> bool:
+        return False
+
+    def mark(self, stage: str, candidates: Any = None) -> None:
+        pass
+
+    def finish(self) -> None:
+        return None
+
+
+NULL_RECORDER = _NullRecorder()
+
+
+def recorder(enabled: bool = False) -> Any:
+    """A live recorder if timings were requested or a hook is active, else the shared no-op."""
+    if enabled or _HOOK.get() is not None:
+        return _Recorder()
+    return NULL_RECORDER
@@ -0,0 +1,39 @@
+# scripts/bench_sharded_scoring.py
+# עקומת האצה של rank_cars(..., workers=N) על קטלוג סינתטי בגודל listings (ברירת מחדל 1M שורות)
+# הרצה: python -m scripts.bench_sharded_scoring --rows 1000000 --workers 1 2 4 8
+from __future__ import annotations
+import argparse, os, time
+
+from benchmarks.synthetic import synthetic_catalog
+from matching.engine import UserProfile, preprocess_catalog, rank_cars
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark sharded (multi-process) scoring.")
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    print(f"Building synthetic catalog: {args.rows:,} rows (cpu_count={os.cpu_count()})")
+    t0 = time.perf_counter()
+    df = preprocess_catalog(synthetic_catalog(args.rows))
+    print(f"  preprocess: {time.perf_counter() - t0:.1f}s")
+
+    profile = UserProfile(passengers=4, budget=40000, ownership_years=6)
+    baseline = None
+    for workers in args.workers:
+        w = workers if workers > 1 else None
+        rank_cars(profile, df, top_n=10, workers=w)  # warm-up: pool, shared matrix, filter index
+        times = []
+        for _ in range(args.repeat):
+            t = time.perf_counter()
+            rank_cars(profile, df, top_n=10, workers=w)
+            times.append(time.perf_counter() - t)
+        best = min(times)
+        baseline = baseline or best
+        print(f"workers={workers:<3} best={best * 1e3:8.1f} ms  speedup={baseline / best:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
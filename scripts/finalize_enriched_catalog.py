@@ -124,7 +124,10 @@ def main():
         shutil.copy2(out, backup)
 
     print(f"Writing unified catalog → {out}")
-    df.to_parquet(out, index=False)
+    # כתיבה לקובץ זמני והחלפה אטומית — שרת/אפליקציה רצים לא יראו קובץ חצי-כתוב
+    tmp = f"{out}.tmp"
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, out)
     print("Done.")
     # תקציר קטן
     print("\nSummary:")
@@ -1,5 +1,6 @@
 # scripts/merge_scraped_used.py
 import argparse
+import os
 from datetime import datetime
 from typing import Tuple
 
@@ -153,7 +154,10 @@ def main():
     drop_cols = [c for c in merged.columns if c.endswith("_scr")] + ["src_domain", "src_date"]
     merged.drop(columns=drop_cols, inplace=True, errors="ignore")
 
-    merged.to_parquet(args.out, index=False)
+    # כתיבה אטומית (tmp + replace) — האפליקציה טוענת את הקטלוג מחדש כשהקובץ מוחלף
+    tmp = f"{args.out}.tmp"
+    merged.to_parquet(tmp, index=False)
+    os.replace(tmp, args.out)
     print("✅ merged scraped used prices into catalog →", args.out)
     print(f"   updated rows: {updated_rows}")
     if before_cnt or after_cnt:
@@ -0,0 +1,44 @@
+# scripts/prepare_catalog.py
+# בונה מראש את data/catalog_us.prepared.parquet כדי שהאפליקציה לא תריץ preprocess בזמן בקשה
+from __future__ import annotations
+import argparse, os
+
+from matching.engine import (
+    PREPARED_VERSION,
+    catalog_content_hash,
+    catalog_footprint,
+    preprocess_catalog,
+    prepared_catalog_path,
+    slim_catalog,
+    write_prepared_catalog,
+)
+import pandas as pd
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build the prepared (preprocessed) catalog artifact.")
+    ap.add_argument("--catalog", default=os.getenv("CARMATCH_US_CATALOG", "data/catalog_us.parquet"))
+    ap.add_argument("--out", default=None, help="Default: <catalog>.prepared.parquet")
+    args = ap.parse_args()
+
+    if not os.path.exists(args.catalog):
+        raise SystemExit(f"Catalog not found: {args.catalog}")
+
+    out = args.out or prepared_catalog_path(args.catalog)
+    source_hash = catalog_content_hash(args.catalog)
+    print(f"Preprocessing {args.catalog} (sha256 {source_hash[:12]}…)")
+    df = preprocess_catalog(pd.read_parquet(args.catalog))
+    write_prepared_catalog(df, out, source_hash)
+    print(f"Wrote {out}  rows={len(df)}  version={PREPARED_VERSION}")
+
+    # כמה זיכרון כל worker מחזיק: הקטלוג המלא מול ה-serving view
+    full_mb = catalog_footprint(df)["total_bytes"] / 1e6
+    slim = catalog_footprint(slim_catalog(df))
+    print(f"In-memory footprint: full={full_mb:.1f} MB  serving={slim['total_bytes'] / 1e6:.1f} MB")
+    top = sorted(slim["columns"].items(), key=lambda kv: kv[1], reverse=True)[:5]
+    for col, nbytes in top:
+        print(f"  {col:<20} {nbytes / 1e6:.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
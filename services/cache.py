@@ -1,8 +1,9 @@
 # services/cache.py
-import os, json, time, hashlib
-from dataclasses import dataclass
+import os, json, time, hashlib, threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from functools import wraps
-from typing import Any, Callable, Optional
+from typing import Any, Callable, Dict, Hashable, Optional
 
 @dataclass
 class DiskCache:
@@ -40,6 +41,57 @@ class DiskCache:
         except Exception:
             pass
 
+@dataclass
+class MemoryCache:
+    """In-process LRU (maxsize entries) with optional TTL and hit/miss counters. Thread-safe."""
+    maxsize: int = 1024
+    ttl_seconds: Optional[float] = None
+    enabled: bool = True
+    hits: int = 0
+    misses: int = 0
+    _data: "OrderedDict[Hashable, tuple]" = field(default_factory=OrderedDict, repr=False)
+    _lock: Any = field(default_factory=threading.Lock, repr=False)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self.ttl_seconds is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, data: Any) -> None:
+        if not self.enabled or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), data)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
 # אופציונלי: דקורטור נוח לקאשינג פונקציות (נשמר תואם אם השתמשנו בו קודם)
 def cache_result(ttl_hours: int = 24):
     def decorator(func: Callable):
@@ -0,0 +1,24 @@
+import json
+
+from benchmarks.run import compare, run
+from benchmarks.synthetic import synthetic_catalog
+from matching.engine import CATALOG_COLUMNS, _dedupe_keys
+
+
+def test_synthetic_catalog_has_real_schema_and_duplicate_trims():
+    df = synthetic_catalog(2_000, seed=1)
+    assert len(df) == 2_000
+    assert set(CATALOG_COLUMNS) <= set(df.columns)
+    assert df.duplicated(subset=_dedupe_keys(df)).sum() > 0
+    assert synthetic_catalog(2_000, seed=1).equals(df)   # דטרמיניסטי לפי seed
+
+
+def test_runner_reports_every_stage_as_json(tmp_path):
+    report = run(["1500"], repeat=1, profiles=["default", "family_6plus"])
+    stages = {r["stage"] for r in report["results"]}
+    assert {"preprocess_catalog", "filter_index_build", "filter", "score", "diversify", "finalize", "rank_cars"} <= stages
+    assert all(r["median_ms"] >= 0 for r in report["results"])
+
+    path = tmp_path / "bench.json"
+    path.write_text(json.dumps(report))
+    assert len(compare(report, json.loads(path.read_text()))) == len(report["results"])
@@ -1,5 +1,7 @@
+import os
 import pandas as pd
 import numpy as np
+import pytest
 from matching.engine import UserProfile, rank_cars
 
 def _fake_row(make, model, fuel, mpg, seats=5, safety=5, vclass="Small Sport Utility Vehicle 2WD", rng=None):
@@ -57,3 +59,393 @@ def test_passenger_filter():
     out = rank_cars(profile, df, top_n=5)
     # Only the 6-seat should pass
     assert (out["model"] == "SixSeat").all()
+
+def test_prepared_catalog_artifact(tmp_path):
+    from matching.engine import load_catalog, prepared_catalog_path, is_prepared
+    src = tmp_path / "catalog_us.parquet"
+    pd.DataFrame([
+        _fake_row("EVCo", "Long", "Electricity", mpg=120, rng=300),
+        _fake_row("GasCo", "Efficient", "Regular", mpg=40),
+        _fake_row("GasCo", "Thirsty", "Regular", mpg=22),
+    ]).to_parquet(src, index=False)
+
+    first = load_catalog(str(src), prepared=True)
+    assert is_prepared(first)
+    assert os.path.exists(prepared_catalog_path(str(src)))
+
+    # second load comes from the artifact and ranks exactly like the raw catalog
+    second = load_catalog(str(src), prepared=True)
+    profile = UserProfile(passengers=4)
+    expected = rank_cars(profile, load_catalog(str(src)), top_n=3)
+    pd.testing.assert_frame_equal(rank_cars(profile, second, top_n=3), expected)
+
+    # a rebuilt source catalog invalidates the artifact
+    pd.DataFrame([_fake_row("Solo", "Only", "Regular", mpg=30)]).to_parquet(src, index=False)
+    assert len(load_catalog(str(src), prepared=True)) == 1
+
+    # כמה workers בונים מחדש בבת אחת — כל כותב עם קובץ זמני משלו, בלי שאריות
+    from concurrent.futures import ThreadPoolExecutor
+    from matching.engine import write_prepared_catalog, preprocess_catalog
+    prepared = preprocess_catalog(pd.read_parquet(src))
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda _: write_prepared_catalog(prepared, prepared_catalog_path(str(src)), "h"), range(8)))
+    assert len(pd.read_parquet(prepared_catalog_path(str(src)))) == 1
+    assert not list(tmp_path.glob("*.tmp"))
+
+def _mixed_catalog():
+    rows = [
+        _fake_row("EVCo", "Long", "Electricity", mpg=120, rng=310),
+        _fake_row("EVCo", "NoRange", "Electricity", mpg=105, rng=None),
+        _fake_row("PlugCo", "P1", "Regular Gas and Electricity", mpg=45, vclass="Midsize Cars"),
+        _fake_row("PlugCo", "P2", "Premium and Electricity", mpg=52, rng=280),
+        _fake_row("GasCo", "Compact", "Regular", mpg=34, vclass="Compact Cars"),
+        _fake_row("GasCo", "Hauler", "Regular", mpg=18, seats=7, vclass="Standard Pickup Trucks 4WD"),
+        _fake_row("GasCo", "Unrated", "Premium", mpg=None, safety=None, seats=6, vclass="Minivan - 2WD"),
+        _fake_row("Diesel", "D", "Diesel", mpg=31, seats=5, safety=3),
+    ]
+    df = pd.DataFrame(rows)
+    df.loc[2, "electricRange_mi"] = 42
+    df["price_best"] = [41000, 35000, 29000, 52000, 21000, 38000, np.nan, 26000]
+    df["recalls_count"] = [0, 3, 1, 7, 2, 0, 1, 4]
+    df["complaints_count"] = [5, 40, 9, 80, 12, 2, 0, 30]
+    return df
+
+def test_vectorized_scores_match_row_scoring():
+    from matching.engine import (
+        preprocess_catalog, _effective_weights, _score_components, _combine_scores, score_vehicle_row_v2,
+    )
+    df = preprocess_catalog(_mixed_catalog())
+    profiles = [
+        UserProfile(passengers=4),
+        UserProfile(passengers=6, usage="city", budget=30000, ownership_years=6),
+        UserProfile(passengers=2, usage="highway", budget=45000, annual_km=8000, prioritize_safety=False),
+    ]
+    for profile in profiles:
+        weights = _effective_weights(profile, df)
+        fast = _combine_scores(_score_components(df, profile), weights)
+        slow = np.array([score_vehicle_row_v2(row, profile, weights)["score"] for _, row in df.iterrows()])
+        assert np.array_equal(fast, slow, equal_nan=True)
+
+def test_diversify_positions_model_cap():
+    from matching.engine import _diversify_positions
+    models = np.array([0, 0, 1, 2, 1, 3])
+    fuels = np.array([0, 0, 0, 1, 1, 0])
+    assert _diversify_positions(models, fuels, top_n=3, max_per_model=1, max_share_per_fuel=0.7) == [0, 2, 3]
+    assert _diversify_positions(models, fuels, top_n=10, max_per_model=2, max_share_per_fuel=1.0) == [0, 1, 2, 3, 4, 5]
+
+def test_rank_cars_batch_matches_single_profile_ranking():
+    from matching.engine import rank_cars_batch
+    df = _mixed_catalog()
+    profiles = [
+        UserProfile(passengers=4),
+        UserProfile(passengers=6, budget=40000, ownership_years=6, usage="city"),
+        UserProfile(passengers=2, budget=30000, usage="highway", prioritize_space=True),
+        UserProfile(passengers=9),  # nothing seats nine
+    ]
+    batch = rank_cars_batch(profiles, df, top_n=5, chunk_size=2)
+    assert len(batch) == len(profiles)
+    for profile, got in zip(profiles, batch):
+        pd.testing.assert_frame_equal(got, rank_cars(profile, df, top_n=5))
+
+def test_filter_index_is_cached_and_read_only():
+    from matching.engine import preprocess_catalog
+    from matching.filter_index import filter_index
+    df = preprocess_catalog(_mixed_catalog())
+    idx = filter_index(df)
+    assert filter_index(df) is idx
+    assert idx.fuel["bev"].tolist() == [True, True, False, True, False, False, False, False]
+    assert idx.fuel["phev"].tolist() == [False, False, True, True, False, False, False, False]
+    assert idx.seats_at_least(6).sum() == 2
+    with pytest.raises(ValueError):
+        idx.car_class &= False
+
+def test_sorted_range_indexes_match_column_scans():
+    from matching.engine import preprocess_catalog
+    from matching.filter_index import filter_index
+    df = preprocess_catalog(_mixed_catalog())
+    idx = filter_index(df)
+    for budget in (0, 21000, 29500, 1e9):
+        expected = (df["price_best"].notna() & (df["price_best"] <= budget)).to_numpy()
+        assert np.array_equal(idx.price_at_most(budget), expected)
+    for min_mpg in (0, 34, 200):
+        expected = (pd.to_numeric(df["MPG_comb"], errors="coerce").fillna(0) >= min_mpg).to_numpy()
+        assert np.array_equal(idx.mpg_at_least(min_mpg), expected)
+
+def test_slim_serving_view_ranks_identically():
+    from matching.engine import preprocess_catalog, slim_catalog, catalog_footprint
+    full = preprocess_catalog(_mixed_catalog().assign(raw_fe_json='{"comb08": 30}'))
+    slim = slim_catalog(full)
+    assert "raw_fe_json" not in slim.columns
+    assert slim["price_best"].dtype == np.float32
+    assert catalog_footprint(slim)["total_bytes"] < catalog_footprint(full)["total_bytes"]
+    for profile in (UserProfile(passengers=4, budget=45000), UserProfile(passengers=6, ownership_years=6)):
+        pd.testing.assert_frame_equal(
+            rank_cars(profile, slim, top_n=5), rank_cars(profile, full, top_n=5),
+            check_dtype=False, check_categorical=False,
+        )
+
+def test_load_catalog_projects_columns(tmp_path):
+    from matching.engine import load_catalog, load_serving_catalog
+    src = tmp_path / "catalog_us.parquet"
+    _mixed_catalog().assign(raw_fe_json='{"comb08": 30}').to_parquet(src, index=False)
+
+    df = load_catalog(str(src), columns=["make", "model", "not_a_column"])
+    assert list(df.columns) == ["make", "model"]
+
+    serving = load_serving_catalog(str(src))      # builds the prepared artifact
+    again = load_serving_catalog(str(src))        # reads it back, projected
+    assert "raw_fe_json" not in again.columns
+    assert {"mpg_norm", "is_bev", "price_best"} <= set(again.columns)
+    pd.testing.assert_frame_equal(again, serving)
+
+def test_ranking_session_recomputes_only_changed_stages():
+    from dataclasses import replace
+    from matching.engine import RankingSession, preprocess_catalog
+    df = preprocess_catalog(_mixed_catalog())
+    session = RankingSession()
+    base = UserProfile(passengers=4, budget=30000)
+    corrections = [
+        base,
+        replace(base, budget=35000),                 # budget only
+        replace(base, budget=35000, usage="city"),   # usage only
+        replace(base, budget=35000, usage="city", ownership_years=6),  # weights only
+        replace(base, budget=35000, usage="city", passengers=6),       # candidate set
+    ]
+    for profile in corrections:
+        pd.testing.assert_frame_equal(session.rank(profile, df, top_n=5), rank_cars(profile, df, top_n=5))
+    assert session.stage_runs == {"prepare": 1, "candidates": 2, "usage": 3, "budget": 3}
+
+    session.rank(base, _mixed_catalog(), top_n=5)    # קטלוג אחר — מתחילים מאפס
+    assert session.stage_runs["candidates"] == 1
+
+def test_streaming_ranker_matches_in_memory_ranking(tmp_path):
+    from matching.engine import SERVING_COLUMNS, load_catalog, rank_cars_streaming
+    src = tmp_path / "catalog_us.parquet"
+    raw = _mixed_catalog()
+    raw.loc[[0, 1, 2], "price_best"] = np.nan        # מחירים מופיעים רק באמצע הזרם
+    pd.concat([raw, raw.iloc[[4, 0]]], ignore_index=True).to_parquet(src, index=False)  # + כפילויות
+    with pytest.raises(ValueError):
+        rank_cars_streaming(UserProfile(), str(src))  # אין עדיין artifact מוכן
+
+    full = load_catalog(str(src), prepared=True, columns=SERVING_COLUMNS)
+    for profile in [UserProfile(passengers=4), UserProfile(passengers=2, budget=40000, ownership_years=6)]:
+        expected = rank_cars(profile, full, top_n=4)
+        for batch_size in (1, 3, 100):
+            got = rank_cars_streaming(profile, str(src), top_n=4, batch_size=batch_size)
+            pd.testing.assert_frame_equal(got, expected)
+
+def test_sharded_ranking_matches_single_process():
+    from matching.engine import preprocess_catalog
+    from matching.parallel import rank_cars_sharded
+    raw = pd.concat([_mixed_catalog()] * 3, ignore_index=True)
+    raw["model"] = raw["model"] + (raw.index // 8).astype(str)   # שלושה עותקים שונים, לא כפילויות
+    df = preprocess_catalog(raw)
+    for profile in [UserProfile(passengers=4), UserProfile(passengers=2, budget=40000, usage="city")]:
+        expected = rank_cars(profile, df, top_n=6)
+        got = rank_cars_sharded(profile, df, workers=3, top_n=6, min_shard_rows=2)
+        pd.testing.assert_frame_equal(got, expected)
+    # מעט מועמדים — נופלים חזרה לתהליך יחיד
+    pd.testing.assert_frame_equal(rank_cars(UserProfile(), df, workers=4), rank_cars(UserProfile(), df))
+
+def test_worker_keeps_only_the_current_shared_matrix():
+    from multiprocessing import shared_memory
+    from matching import parallel
+    segments = [shared_memory.SharedMemory(create=True, size=64) for _ in range(2)]
+    try:
+        first = parallel._attach(segments[0].name)
+        assert parallel._attach(segments[0].name) is first
+        parallel._attach(segments[1].name)                   # catalog hot reload → מטריצה חדשה
+        assert list(parallel._ATTACHED) == [segments[1].name]
+        assert first.buf is None                             # המיפוי הישן נסגר
+    finally:
+        for shm in parallel._ATTACHED.values():
+            shm.close()
+        parallel._ATTACHED.clear()
+        for shm in segments:
+            shm.close()
+            shm.unlink()
+
+def test_powertrain_enum_drives_hybrid_and_diesel_filters():
+    from matching.engine import POWERTRAINS, preprocess_catalog
+    raw = pd.concat([_mixed_catalog(), pd.DataFrame([
+        _fake_row("Toyota", "Prius", "Regular", mpg=56),
+        _fake_row("Lexus", "ES 300h", "Regular", mpg=44, vclass="Midsize Cars"),
+    ])], ignore_index=True)
+    df = preprocess_catalog(raw)
+    assert list(df["powertrain"].cat.categories) == POWERTRAINS
+    assert list(df["powertrain"].astype(str)) == ["BEV", "BEV", "PHEV", "PHEV", "ICE", "ICE", "ICE", "diesel", "HEV", "HEV"]
+
+    profile = UserProfile(passengers=4, prioritize_space=True)
+    assert set(rank_cars(profile, df, top_n=10, fuel_type="hybrid")["model"]) == {"Prius", "ES 300h"}
+    assert set(rank_cars(profile, df, top_n=10, fuel_type="diesel")["model"]) == {"D"}
+
+def test_stage_timings_metadata_and_hook():
+    from matching.engine import preprocess_catalog
+    from matching.timing import stage_timing
+    df = preprocess_catalog(_mixed_catalog())
+    profile = UserProfile(passengers=4, budget=30000)
+    plain = rank_cars(profile, df, top_n=5)
+    assert "stage_timings" not in plain.attrs          # כבוי — בלי metadata
+
+    timed = rank_cars(profile, df, top_n=5, timings=True)
+    pd.testing.assert_frame_equal(timed, plain)
+    info = timed.attrs["stage_timings"]
+    stages = {s["stage"]: s for s in info["stages"]}
+    assert list(stages) == ["prepare", "filter", "dedupe", "components", "budget", "score", "sort", "diversify", "finalize"]
+    assert stages["prepare"]["candidates"] == len(df)
+    assert stages["finalize"]["candidates"] == len(plain)
+    # חד-פעמי: רכיבים רק לשורות בתקציב, לא לכל המועמדים
+    assert stages["components"]["candidates"] == stages["budget"]["candidates"] < stages["dedupe"]["candidates"]
+    assert info["total_ms"] >= sum(s["ms"] for s in info["stages"]) - 1e-3
+
+    seen = []
+    with stage_timing(seen.append):
+        rank_cars(profile, df, top_n=5)
+    rank_cars(profile, df, top_n=5)                    # מחוץ ל-context — ה-hook לא נקרא
+    assert len(seen) == 1 and seen[0].stages[-1].stage == "finalize"
+
+def test_return_components_reconstruct_score():
+    from matching.engine import COMPONENT_COLUMNS, SCORE_COMPONENTS, WEIGHT_COLUMNS, preprocess_catalog, rank_cars_batch
+    df = preprocess_catalog(_mixed_catalog())
+    profile = UserProfile(passengers=4, budget=30000, ownership_years=6)
+    plain = rank_cars(profile, df, top_n=5)
+    full = rank_cars(profile, df, top_n=5, return_components=True)
+    assert list(full.columns) == list(plain.columns) + COMPONENT_COLUMNS + WEIGHT_COLUMNS
+    pd.testing.assert_frame_equal(full[list(plain.columns)], plain)
+    rebuilt = sum(full[f"w_{wkey}"] * full[comp] for wkey, comp in SCORE_COMPONENTS)
+    np.testing.assert_array_equal(rebuilt.to_numpy(), full["score"].to_numpy())
+    assert full["w_budget"].iloc[0] > 0 and full[WEIGHT_COLUMNS].iloc[0].sum() == pytest.approx(1.0)
+    pd.testing.assert_frame_equal(rank_cars_batch([profile], df, top_n=5, return_components=True)[0], full)
+
+def test_similar_to_matches_brute_force_and_filters():
+    from matching.engine import preprocess_catalog, slim_catalog, vehicle_keys
+    from matching.similarity import similar_to, similarity_index
+    raw = pd.concat([_mixed_catalog(), _mixed_catalog().iloc[[0]]], ignore_index=True)   # + כפילות
+    df = preprocess_catalog(raw)
+    keys = vehicle_keys(df)
+    assert keys[0] == keys[-1] and len(set(keys)) == 8
+    np.testing.assert_array_equal(vehicle_keys(slim_catalog(df)), keys)   # לא תלוי ב-dtypes
+
+    idx = similarity_index(df)
+    q = idx.features[idx.row_of(keys[4])].astype(float)
+    dist = np.sqrt(((idx.features.astype(float) - q) ** 2).sum(axis=1))
+    expected = [p for p in np.argsort(dist, kind="stable") if p != idx.row_of(keys[4])][:3]
+    got = similar_to(df, keys[4], k=3)
+    assert list(got["vehicle_key"]) == list(idx.keys[expected])
+    assert got["distance"].is_monotonic_increasing and keys[4] not in set(got["vehicle_key"])
+
+    bev = similar_to(df, keys[4], k=5, filters={"fuel_type": "bev", "budget": 40000})
+    assert list(bev["model"]) == ["NoRange"]
+    assert similar_to(df, keys[0], k=5)["model"].tolist().count("Long") == 0
+    with pytest.raises(KeyError):
+        similar_to(df, 12345, k=3)
+    with pytest.raises(ValueError):
+        similar_to(df, keys[0], filters={"color": "red"})
+
+def test_pareto_pruning_keeps_rankings_identical():
+    from dataclasses import replace
+    from matching.engine import preprocess_catalog
+    from matching.filter_index import filter_index
+    from matching.pareto import dominance_counts, pareto_frontier
+    rng = np.random.default_rng(3)
+    n = 600
+    raw = pd.DataFrame({
+        "make": rng.choice(["A", "B"], n), "model": rng.choice(["x", "y", "z"], n),
+        "option_text": rng.choice(["o1", "o2", "o3", "o4"], n),
+        "VClass": rng.choice(["Compact Cars", "Small Sport Utility Vehicle 4WD"], n),
+        "fuelType": rng.choice(["Regular", "Electricity"], n),
+        "MPG_comb": rng.choice([20.0, 30.0, 35.0, np.nan], n), "overall_safety": rng.choice([3.0, 5.0, np.nan], n),
+        "passengers": rng.choice([4.0, 5.0], n), "Range_mi": rng.choice([np.nan, 300.0], n),
+        "price_best": rng.choice([np.nan, 20000.0, 30000.0], n),
+        "recalls_count": rng.integers(0, 5, n), "complaints_count": rng.integers(0, 50, n),
+    })
+    df = preprocess_catalog(raw)
+    counts = dominance_counts(df)
+    assert (counts[~filter_index(df).first_occurrence] == -1).all()   # כפילויות לא נספרות
+    assert 0 < pareto_frontier(df).sum() < (counts >= 0).sum()      # באמת נגזם משהו
+
+    base = UserProfile(passengers=4, budget=None)
+    for profile in [base, replace(base, usage="city", prioritize_safety=False), replace(base, ownership_years=7, passengers=2)]:
+        for max_per_model in (1, 2, 3):
+            for kw in ({}, {"fuel_type": "bev"}, {"min_mpg": 30}):
+                expected = rank_cars(profile, df, top_n=6, max_per_model=max_per_model, **kw)
+                got = rank_cars(profile, df, top_n=6, max_per_model=max_per_model, pareto_slack=0, **kw)
+                pd.testing.assert_frame_equal(got, expected)
+    # תקציב פעיל — אין גיזום (התאמת התקציב עולה עם המחיר)
+    budgeted = replace(base, budget=25000)
+    pd.testing.assert_frame_equal(rank_cars(budgeted, df, top_n=6, pareto_slack=0), rank_cars(budgeted, df, top_n=6))
+
+def test_weight_overrides_and_session_rerank():
+    from dataclasses import replace
+    from matching.engine import RankingSession, _weights_for, preprocess_catalog
+    w = _weights_for(UserProfile(weights={"efficiency": 0.0, "safety": 2, "space": -1}), has_price=False, has_reliability=False)
+    assert w["mpg"] == 0.0 and w["passengers"] == 0.0 and w["safety"] > 0.8
+    assert sum(w.values()) == pytest.approx(1.0)
+
+    df = preprocess_catalog(_mixed_catalog())
+    session = RankingSession()
+    base = UserProfile(passengers=4, budget=45000, ownership_years=6)
+    session.rank(base, df, top_n=4)
+    runs = dict(session.stage_runs)
+    for sliders in [{"safety": 1.0}, {"efficiency": 1.0, "budget": 0.5}, {"reliability": 1.0, "space": 0.2}]:
+        pd.testing.assert_frame_equal(session.rerank(sliders), rank_cars(replace(base, weights=sliders), df, top_n=4))
+    assert session.stage_runs == runs                  # רק סכום משוקלל + מיון, בלי לבנות מועמדים מחדש
+    assert session.rerank({"efficiency": 1.0}).iloc[0]["model"] == "Long"
+    with pytest.raises(RuntimeError):
+        RankingSession().rerank({"safety": 1.0})
+
+def test_vehicle_key_column_drives_dedupe():
+    from matching.engine import _hash_vehicle_keys, preprocess_catalog, vehicle_keys
+    from matching.filter_index import DEDUPE_KEYS, build_filter_index
+    raw = pd.concat([_mixed_catalog(), _mixed_catalog().iloc[[3, 0]]], ignore_index=True)
+    raw.loc[len(raw) - 1, "price_best"] = 1          # כפילות עם מחיר אחר — אותו רכב
+    df = preprocess_catalog(raw)
+    assert df["vehicle_key"].dtype == np.uint64
+    np.testing.assert_array_equal(vehicle_keys(df), _hash_vehicle_keys(df.drop(columns="vehicle_key")))
+    np.testing.assert_array_equal(
+        build_filter_index(df).first_occurrence, ~df.duplicated(subset=DEDUPE_KEYS).to_numpy(),
+    )
+    without_dups = rank_cars(UserProfile(passengers=2), preprocess_catalog(_mixed_catalog()), top_n=20)
+    assert list(rank_cars(UserProfile(passengers=2), df, top_n=20)["model"]) == list(without_dups["model"])
+
+def test_progressive_ranking_yields_provisional_then_final():
+    from benchmarks.synthetic import synthetic_catalog
+    from matching.engine import preprocess_catalog
+    from matching.progressive import FINAL, PROVISIONAL, provisional_segment, rank_cars_progressive
+    df = preprocess_catalog(synthetic_catalog(20_000))
+    segment = provisional_segment(df)
+    assert segment is provisional_segment(df)                   # cache לפי frame
+    assert len(segment) < 0.25 * len(df) and not segment["vehicle_key"].duplicated().any()
+
+    profile = UserProfile(passengers=6, budget=35000, ownership_years=6)
+    kw = dict(top_n=3, fuel_type="hybrid")
+    stages = list(rank_cars_progressive(profile, df, **kw))
+    assert [s for s, _ in stages] == [PROVISIONAL, FINAL]
+    provisional, final = stages[0][1], stages[1][1]
+    assert len(provisional) == 3
+    pd.testing.assert_frame_equal(provisional, rank_cars(profile, segment, **kw))
+    pd.testing.assert_frame_equal(final, rank_cars(profile, df, **kw))
+    assert provisional["score"].iloc[0] <= final["score"].iloc[0]
+
+    small = preprocess_catalog(_mixed_catalog())                # מקטע ≈ כל הקטלוג — ישר לתשובה המלאה
+    assert [s for s, _ in rank_cars_progressive(UserProfile(passengers=4), small)] == [FINAL]
+
+def test_budget_below_every_price_keeps_result_schema():
+    from matching.engine import RankingSession, preprocess_catalog, rank_cars_batch
+    df = preprocess_catalog(_mixed_catalog())
+    profile = UserProfile(passengers=4, budget=100)          # זול מכל מחיר בקטלוג
+    for kw in ({}, {"return_components": True}):
+        one_shot = rank_cars(profile, df, **kw)
+        assert one_shot.empty and "score" in one_shot.columns
+        pd.testing.assert_frame_equal(one_shot, RankingSession().rank(profile, df, **kw))
+        pd.testing.assert_frame_equal(one_shot, rank_cars_batch([profile], df, **kw)[0])
+
+def test_mixed_type_key_columns_hash_like_strings():
+    from matching.engine import _hash_vehicle_keys, preprocess_catalog
+    raw = _mixed_catalog()
+    # NHTSA מחזיר OverallRating כמחרוזת, שורות אחרות מחזיקות int
+    raw["overall_safety"] = pd.Series([5, "5", 5, "4", None, 3, None, "3"], dtype=object)
+    df = preprocess_catalog(raw)
+    as_strings = raw.assign(overall_safety=raw["overall_safety"].map(lambda v: None if v is None else str(v)))
+    np.testing.assert_array_equal(df["vehicle_key"].to_numpy(), _hash_vehicle_keys(as_strings))
+    assert len(rank_cars(UserProfile(passengers=4), df, top_n=5)) == 5
@@ -0,0 +1,241 @@
+import os
+import pandas as pd
+import pytest
+
+from agent.catalog_store import CatalogStore
+import agent.orchestrator as orchestrator
+from agent.orchestrator import get_recommendations, clear_result_cache, result_cache_stats
+
+
+def _row(make, model, fuel, mpg, seats=5, price=25000, vclass="Small Sport Utility Vehicle 2WD", rng=None):
+    return {
+        "year": 2022, "make": make, "model": model, "option_text": "Auto (A1)", "VClass": vclass,
+        "fuelType": fuel, "MPG_comb": mpg, "overall_safety": 5, "passengers": seats,
+        "Range_mi": rng, "price_best": price, "price_source": "msrp_est",
+    }
+
+
+def _write_catalog(path, rows):
+    pd.DataFrame(rows).to_parquet(path, index=False)
+    # מבטיח mtime שונה גם במערכות קבצים עם רזולוציה גסה
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000 * (1 + len(rows))))
+
+
+@pytest.fixture
+def catalog_path(tmp_path):
+    path = tmp_path / "catalog_us.parquet"
+    _write_catalog(path, [
+        _row("EVCo", "Long", "Electricity", 120, rng=300, price=38000),
+        _row("GasCo", "Efficient", "Regular", 40, price=22000),
+        _row("GasCo", "Thirsty", "Regular", 22, price=18000),
+        _row("Family", "Hauler", "Regular", 24, seats=7, vclass="Minivan - 2WD", price=33000),
+    ])
+    return str(path)
+
+
+def test_catalog_store_loads_once_and_hot_reloads(catalog_path):
+    store = CatalogStore(check_interval=0.0)
+    first = store.get(catalog_path)
+    assert store.get(catalog_path) is first          # אותו frame לכל הקוראים
+
+    _write_catalog(catalog_path, [_row("Solo", "Only", "Regular", 30)])
+    swapped = store.get(catalog_path)
+    assert swapped is not first
+    assert swapped.version != first.version
+    assert list(swapped.frame["model"]) == ["Only"]
+    assert len(first.frame) == 4                     # קורא ישן ממשיך עם הגרסה שלו
+
+
+def test_get_recommendations_uses_shared_catalog(catalog_path):
+    res = get_recommendations({"passengers": 4, "budget_usd": 40000}, catalog_path=catalog_path)
+    assert res["count"] == 3
+    assert {it["model"] for it in res["results"]} <= {"Long", "Efficient", "Thirsty"}
+
+
+def test_result_cache_hits_and_invalidates_on_catalog_swap(catalog_path, monkeypatch):
+    monkeypatch.setattr(orchestrator, "get_catalog_store", lambda: CatalogStore(check_interval=0.0))
+    clear_result_cache()
+    answers = {"passengers": 4, "budget_usd": 40000, "fuel_type": "any"}
+
+    first = get_recommendations(answers, catalog_path=catalog_path)
+    first["results"][0]["model"] = "mutated by UI"
+    again = get_recommendations(dict(answers, budget_usd="40000"), catalog_path=catalog_path)
+    assert result_cache_stats()["hits"] == 1
+    assert again["results"][0]["model"] != "mutated by UI"
+
+    _write_catalog(catalog_path, [_row("Solo", "Only", "Regular", 30)])
+    swapped = get_recommendations(answers, catalog_path=catalog_path)
+    assert [it["model"] for it in swapped["results"]] == ["Only"]
+    assert result_cache_stats()["misses"] == 2
+
+
+def test_get_recommendations_forwards_stage_timings(catalog_path):
+    clear_result_cache()
+    sink = []
+    answers = {"passengers": 4, "budget_usd": 40000}
+    get_recommendations(answers, catalog_path=catalog_path, on_timings=sink.append)
+    get_recommendations(answers, catalog_path=catalog_path, on_timings=sink.append)
+    assert [t.cached for t in sink] == [False, True]
+    assert "filter" in [s.stage for s in sink[0].stages]
+
+
+def test_get_similar_uses_item_vehicle_key(catalog_path):
+    from agent.orchestrator import get_similar
+    answers = {"passengers": 4, "budget_usd": 40000}
+    top = get_recommendations(answers, catalog_path=catalog_path)["results"][0]
+    res = get_similar(top["vehicle_key"], k=5, answers=answers, catalog_path=catalog_path)
+    models = [it["model"] for it in res["results"]]
+    assert top["model"] not in models and "Hauler" not in models     # טנדר 7 מושבים — לא ל-4 נוסעים
+    assert all(isinstance(it["vehicle_key"], int) and it["distance"] >= 0 for it in res["results"])
+
+
+def test_progressive_recommendations_end_with_cached_final(catalog_path, monkeypatch):
+    from agent.orchestrator import get_recommendations_progressive
+    # הקטלוג בבדיקה קטן מדי למקטע אמיתי — מקטע קבוע של שני רכבי הבנזין
+    monkeypatch.setattr(orchestrator, "provisional_segment", lambda df: df[df["make"] == "GasCo"])
+    clear_result_cache()
+    sink = []
+    answers = {"passengers": 4, "budget_usd": 40000}
+    steps = list(get_recommendations_progressive(answers, catalog_path=catalog_path, on_timings=sink.append))
+    assert [s["final"] for s in steps] == [False, True]
+    assert {it["model"] for it in steps[0]["results"]} == {"Efficient", "Thirsty"}
+    assert len(sink) == 2 and not any(t.cached for t in sink)
+
+    final = get_recommendations(answers, catalog_path=catalog_path)
+    assert result_cache_stats()["hits"] == 1                       # הסופית נשמרה ב-cache
+    assert steps[-1]["results"] == final["results"]
+    again = list(get_recommendations_progressive(answers, catalog_path=catalog_path))
+    assert [s["final"] for s in again] == [True]
+
+
+def test_async_recommendations_limit_concurrency_and_cancel(catalog_path, monkeypatch):
+    import asyncio
+    import threading
+    import time
+    from agent.orchestrator import get_recommendations_async
+    from matching.timing import stage_timing
+    monkeypatch.setattr(orchestrator, "MAX_CONCURRENT_RANKS", 2)
+    clear_result_cache()
+    expected = get_recommendations({"passengers": 4, "budget_usd": 40000}, catalog_path=catalog_path)
+
+    lock = threading.Lock()
+    running, peak = [0], [0]
+    real_rank_items = orchestrator._rank_items
+
+    def slow_rank_items(*args):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        try:
+            return real_rank_items(*args)
+        finally:
+            with lock:
+                running[0] -= 1
+
+    monkeypatch.setattr(orchestrator, "_rank_items", slow_rank_items)
+
+    async def main():
+        sink = []
+        with stage_timing(sink.append):          # ה-hook של הקורא עובר ל-executor עם ה-context
+            results = await asyncio.gather(*[
+                get_recommendations_async({"passengers": 4, "budget_usd": 30000 + i * 1000}, catalog_path=catalog_path)
+                for i in range(6)
+            ])
+        assert peak[0] == 2 and len(sink) == 6
+        assert all(r["count"] >= 1 for r in results)
+
+        task = asyncio.create_task(get_recommendations_async({"passengers": 2}, catalog_path=catalog_path))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.1)                  # הדירוג שהתחיל מסתיים ברקע ונכנס ל-cache
+        hits = result_cache_stats()["hits"]
+        await get_recommendations_async({"passengers": 2}, catalog_path=catalog_path)
+        assert result_cache_stats()["hits"] == hits + 1
+        return await get_recommendations_async({"passengers": 4, "budget_usd": 40000}, catalog_path=catalog_path)
+
+    assert asyncio.run(main())["results"] == expected["results"]
+
+
+def test_recommendation_server_endpoints(catalog_path):
+    import http.client
+    import json
+    import threading
+    import urllib.error
+    import urllib.request
+    from agent.server import RecommendationServer, _clean
+
+    server = RecommendationServer(("127.0.0.1", 0), catalog_path=catalog_path, workers=2)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    def call(path, body=None):
+        req = urllib.request.Request(base + path, data=body, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=10) as resp:
+                return resp.status, json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    answers = {"passengers": 4, "budget_usd": 40000}
+    try:
+        assert call("/healthz") == (200, {"status": "ok"})
+        assert call("/readyz")[0] == 503                     # עוד לא נטען
+        assert call("/recommend", json.dumps(answers).encode())[0] == 503
+
+        server.start_preload().join(timeout=30)
+        status, ready = call("/readyz")
+        assert status == 200 and ready["rows"] == 4
+
+        status, res = call("/recommend", json.dumps(answers).encode())
+        assert status == 200
+        assert res["results"] == _clean(get_recommendations(answers, catalog_path=catalog_path)["results"])   # NaN → null
+        assert call("/recommend", b"[1, 2]")[0] == 400
+        assert call("/recommend", b"{not json")[0] == 400
+        assert call("/nope")[0] == 404
+        for bad_length in ("abc", "-1"):
+            conn = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=5)
+            conn.putrequest("POST", "/recommend")
+            conn.putheader("Content-Length", bad_length)
+            conn.endheaders()
+            assert conn.getresponse().status == 400
+            conn.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_invalid_weight_overrides_are_dropped(catalog_path):
+    import math
+    answers = {"passengers": 4, "budget_usd": 40000}
+    res = get_recommendations(dict(answers, weights={"safety": "hi", "efficiency": float("inf"), "space": "0.5", "budget": None}),
+                              catalog_path=catalog_path)
+    assert res["profile"]["weights"] == {"space": 0.5}
+    assert res["count"] == 3 and all(math.isfinite(it["score"]) for it in res["results"])
+
+    for junk in ("safety", ["safety", 1], 3):                   # לא dict — מתעלמים
+        res = get_recommendations(dict(answers, weights=junk), catalog_path=catalog_path)
+        assert res["profile"]["weights"] == {}
+        assert res["results"] == get_recommendations(answers, catalog_path=catalog_path)["results"]
+
+
+def test_catalog_store_version_comes_from_the_loader(catalog_path, monkeypatch):
+    import agent.catalog_store as catalog_store
+    from matching.engine import catalog_content_hash
+    version = catalog_content_hash(catalog_path)
+
+    def no_second_hash(path):
+        raise AssertionError("the store re-hashed the catalog file")
+
+    monkeypatch.setattr(catalog_store, "catalog_content_hash", no_second_hash)
+    store = CatalogStore(check_interval=0.0)
+    first = store.get(catalog_path)
+    assert first.version == version
+
+    st = os.stat(catalog_path)                                 # touch — אותם בתים
+    os.utime(catalog_path, ns=(st.st_atime_ns, st.st_mtime_ns + 5_000_000_000))
+    touched = store.get(catalog_path)
+    assert touched is not first and touched.frame is first.frame and touched.version == version